@@ -0,0 +1,98 @@
+# Checkpoints of the completed sweep points of a run, from which a killed or crashed run can be resumed
+import os
+import sys
+import glob
+import json
+import hashlib
+import tempfile
+
+from timing_cache import file_digest
+
+manifest_version = 2
+
+def settings(config):
+    # Settings that change the results of a point or the points of data.csv
+    return {"heterogeneity_type": config.homogeneous, "ED_kurtosis_mode": config.ED_kurtosis_mode,
+            "initial_array_size": list(config.initial_array_size), "packer": config.packer,
+            "array_count": list(config.array_count), "number_of_IMEM_sizes": config.number_of_IMEM_sizes}
+
+def inputs_digest(config, kernel_key_list):
+    """
+    Computes the digest of everything the results of a run depend on.
+
+    Args:
+        config (Sweep_Config): The configuration of the run, with the paths of the timing trace and of the kernel model.
+        kernel_key_list (dict): The mapping from kernel names to trace keys.
+
+    Returns:
+        str: A hex digest that changes whenever the trace, the kernel model, the mapping or the settings change.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([manifest_version, kernel_key_list, settings(config)], sort_keys=True).encode())
+    file_digest(config.model_file_path, digest)
+    file_digest(config.timing_file_path, digest)
+    return digest.hexdigest()
+
+def write_json_atomically(path, data):
+    file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(file_descriptor, 'w') as json_file:
+        json.dump(data, json_file, indent=1)
+    os.replace(temp_path, path)
+
+def write_manifest(base_path, digest, config):
+    write_json_atomically(os.path.join(base_path, "manifest.json"), {"version": manifest_version, "inputs_digest": digest, "settings": settings(config)})
+
+def checkpoint_path(base_path, array_count, IMEM_size):
+    return os.path.join(base_path, "checkpoints", f"{array_count}_arrays_{IMEM_size}.json")
+
+def save_checkpoint(base_path, array_count, IMEM_size, csv_row, packing_row):
+    """
+    Records the completed points (array_count, array_id, IMEM size) of an IMEM size, with the rows
+    it adds to data.csv and packing.csv. Written after the locations of the IMEM size.
+    """
+    os.makedirs(os.path.dirname(checkpoint_path(base_path, array_count, IMEM_size)), exist_ok=True)
+    write_json_atomically(checkpoint_path(base_path, array_count, IMEM_size),
+                          {"points": [[array_count, array_id, IMEM_size] for array_id in range(array_count)],
+                           "csv_row": list(csv_row), "packing_row": list(packing_row)})
+
+def load_completed_points(base_path, digest):
+    """
+    Reads the manifest and the checkpoints of a run to be resumed, and exits if its inputs changed since.
+
+    Args:
+        base_path (str): The numbered output directory of the run.
+        digest (str): The inputs digest of the resuming run.
+
+    Returns:
+        dict: (array_count, IMEM size) -> checkpoint, for every IMEM size whose points are complete for all arrays.
+    """
+    manifest_file_path = os.path.join(base_path, "manifest.json")
+    if not os.path.isfile(manifest_file_path):
+        print("There is no manifest.json in", base_path, "to resume from!! Exiting ...")
+        sys.exit(1)
+    with open(manifest_file_path, 'r') as json_file:
+        manifest = json.load(json_file)
+    if manifest["inputs_digest"] != digest:
+        print("The trace, the kernel model or the settings changed since the run in", base_path, "was started!! Exiting ...")
+        print("Settings of that run:", manifest["settings"])
+        sys.exit(1)
+
+    completed_points = {}
+    for checkpoint_file_path in glob.glob(os.path.join(glob.escape(base_path), "checkpoints", "*.json")):
+        with open(checkpoint_file_path, 'r') as json_file:
+            checkpoint = json.load(json_file)
+        array_count, _, IMEM_size = checkpoint["points"][0]
+        if sorted(point[1] for point in checkpoint["points"]) == list(range(array_count)):
+            completed_points[(array_count, IMEM_size)] = checkpoint
+    return completed_points
+
+def is_completed(context, array_count, IMEM_size):
+    return (array_count, IMEM_size) in context.completed_points
+
+def checkpoint_rows(context, array_count, IMEM_size):
+    # The data.csv and packing.csv rows of a completed IMEM size, as process_imem_size returns them
+    checkpoint = context.completed_points[(array_count, IMEM_size)]
+    csv_row = checkpoint["csv_row"]
+    csv_row[6] = tuple(csv_row[6])
+    csv_row[7] = [tuple(array_size) for array_size in csv_row[7]]
+    return tuple(csv_row), tuple(checkpoint["packing_row"])
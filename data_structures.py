@@ -1,9 +1,29 @@
+import bisect
+import numpy as np
+
 class Slice():
-    def __init__(self, kernel_name, start_time, end_time, subband_id, shape):
-        self.kernel_name = kernel_name
-        self.subband_id = subband_id
-        self.slice = (start_time, end_time)
-        self.shape = (shape[0], shape[1])
+    # Lightweight view of one row of a Timing_Data column store
+    __slots__ = ("timing_data", "index")
+
+    def __init__(self, timing_data, index):
+        self.timing_data = timing_data
+        self.index = index
+
+    @property
+    def kernel_name(self):
+        return self.timing_data.kernel_names[self.timing_data.kernel[self.index]]
+
+    @property
+    def subband_id(self):
+        return int(self.timing_data.subband[self.index])
+
+    @property
+    def slice(self):
+        return (float(self.timing_data.start[self.index]), float(self.timing_data.end[self.index]))
+
+    @property
+    def shape(self):
+        return (int(self.timing_data.shape[self.index][0]), int(self.timing_data.shape[self.index][1]))
 
     def __str__(self):
         return f"Slice: kernel name: {self.kernel_name}, subband id: {self.subband_id}, slice: {self.slice}, shape: {self.shape}"
@@ -11,30 +31,122 @@ class Slice():
     def __repr__(self):
         return self.__str__()
 
+class Slice_Pool():
+    """
+    Remaining slices of a Timing_Data: per kernel, its row indices sorted by start time and a bitmap of the live ones.
+    Consuming slices only clears their bits, and the rows of a kernel are compacted when they are read next, so
+    several consumptions between two reads cost a single compaction. Kernels without live slices are skipped,
+    so the pool reads like a dict of kernel name -> row indices of its live slices.
+    """
+    def __init__(self, rows=None):
+        self.rows = {}
+        self.alive = {}
+        self.live_count = {}
+        for key, value in (rows or {}).items():
+            self[key] = value
+
+    def __setitem__(self, key, rows):
+        self.rows[key] = rows
+        self.alive[key] = None
+        self.live_count[key] = len(rows)
+
+    def __getitem__(self, key):
+        if not self.live_count.get(key):
+            raise KeyError(key)
+        if self.alive[key] is not None:
+            self.rows[key] = self.rows[key][self.alive[key]]
+            self.alive[key] = None
+        return self.rows[key]
+
+    def consume(self, key, indices):
+        """
+        Marks slices of a kernel as consumed.
+
+        Args:
+            key (str): The kernel name.
+            indices (list): Indices of the consumed slices in the rows of the kernel as last read from the pool.
+        """
+        if self.alive[key] is None:
+            self.alive[key] = np.ones(len(self.rows[key]), dtype=bool)
+        self.live_count[key] -= int(np.count_nonzero(self.alive[key][indices]))
+        self.alive[key][indices] = False
+
+    def pop(self, key, default=None):
+        if key not in self:
+            return default
+        rows = self[key]
+        del self.rows[key], self.alive[key], self.live_count[key]
+        return rows
+
+    def __contains__(self, key):
+        return bool(self.live_count.get(key))
+
+    def __iter__(self):
+        return (key for key, count in self.live_count.items() if count)
+
+    def __len__(self):
+        return sum(1 for count in self.live_count.values() if count)
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def copy(self):
+        return Slice_Pool({key: value.copy() for key, value in self.items()})
+
 class Timing_Data():
-    def __init__(self):
+    def __init__(self, kernel_names=None, start=None, end=None, subband=None, array_id=None, shape=None, kernel=None):
+        # Struct-of-arrays backing store, one row per timing slice, with float64 times as traces hold fractional timestamps
+        self.kernel_names = kernel_names if kernel_names is not None else []
+        self.start = start if start is not None else np.empty(0, dtype=np.float64)
+        self.end = end if end is not None else np.empty(0, dtype=np.float64)
+        self.subband = subband if subband is not None else np.empty(0, dtype=np.int32)
+        self.array_id = array_id if array_id is not None else np.empty(0, dtype=np.int32)
+        self.shape = shape if shape is not None else np.empty((0, 2), dtype=np.int32)
+        self.kernel = kernel if kernel is not None else np.empty(0, dtype=np.int16)
 
-        self.data = {}
+        # Kernel name -> row indices of its remaining slices, sorted by start time
+        self.data = Slice_Pool()
 
-    def add_new_data(self, kernel_name, slice):
-        if kernel_name in self.data:
-            self.data[kernel_name].append(slice)
-        else:
-            self.data[kernel_name] = [slice]
+    def select(self, rows):
+        return Timing_Data(self.kernel_names, self.start[rows], self.end[rows], self.subband[rows],
+                           self.array_id[rows], self.shape[rows], self.kernel[rows])
+
+    def index_kernels(self):
+        order = np.argsort(self.start, kind="stable")
+        self.data = Slice_Pool()
+        for code, kernel_name in enumerate(self.kernel_names):
+            rows = order[self.kernel[order] == code]
+            if len(rows):
+                self.data[kernel_name] = rows
+
+    def copy(self):
+        # Columns are shared, only the per-kernel row indices are copied
+        new_timing_data = Timing_Data(self.kernel_names, self.start, self.end, self.subband, self.array_id, self.shape, self.kernel)
+        new_timing_data.data = self.data.copy()
+        return new_timing_data
+
+    def slice(self, row):
+        return Slice(self, row)
+
+    def slices(self, rows):
+        return [Slice(self, row) for row in rows.tolist()]
 
     def __str__(self):
         out_stream = []
         for key, value in self.data.items():
             out_stream.append(key + "\n")
-            for item in value:
+            for item in self.slices(value):
                 out_stream.append("[" + item.__str__() + str("]\t"))
         return ''.join(out_stream)
     
     def __len__(self):
-        length = 0
-        for key, value in self.data.items():
-            length += len(value)
-        return length
+        return sum(self.data.live_count.values())
     
     def kernelwise_len(self):
         for key, value in self.data.items():
@@ -54,6 +166,12 @@ class Cluster():
         else:
             self.slices = []
 
+        # Sorted interval index (parallel start/end lists) over the slices of the cluster
+        self.starts = []
+        self.ends = []
+        for slice in self.slices:
+            self.insert_interval(slice.slice)
+
         if IMEM_layer is not None:
             self.IMEM_layer = IMEM_layer
         else:
@@ -64,9 +182,34 @@ class Cluster():
         else:
             self.seed_kernel = None
 
+    def insert_interval(self, interval):
+        position = bisect.bisect_left(self.starts, interval[0])
+        while position < len(self.starts) and self.starts[position] == interval[0] and self.ends[position] < interval[1]:
+            position += 1
+        self.starts.insert(position, interval[0])
+        self.ends.insert(position, interval[1])
+
+    def has_conflict(self, interval):
+        # Slices of a cluster never overlap, so once sorted by start their ends are sorted as well.
+        # Only the last slice starting before the interval ends can therefore overlap with it.
+        position = bisect.bisect_left(self.starts, interval[1])
+        return position > 0 and self.ends[position - 1] > interval[0]
+
+    def conflicts(self, starts, ends):
+        # Vectorized has_conflict over arrays of interval starts and ends
+        if not self.starts:
+            return np.zeros(len(starts), dtype=bool)
+        position = np.searchsorted(np.asarray(self.starts), ends, side="left")
+        return (position > 0) & (np.asarray(self.ends)[position - 1] > starts)
+
+    def add_slice(self, slice):
+        self.slices.append(slice)
+        self.insert_interval(slice.slice)
+
     def extend_cluster(self, kernels, slices):
         self.kernels.extend(kernels)
-        self.slices.extend(slices)
+        for slice in slices:
+            self.add_slice(slice)
 
     def extend_kernels(self, kernels):
         self.kernels.extend(kernels)
@@ -77,6 +220,68 @@ class Cluster():
     def __repr__(self):
         return self.__str__()
 
+class Occupancy_Grid():
+    # PE array of a fixed width whose height grows as kernels are placed
+    # Start rows of free windows are searched in blocks of this many rows, stopping at the first block with one
+    row_block = 64
+
+    def __init__(self, width):
+        self.width = width
+        self.height = 0
+        self.occupied = np.zeros((0, width), dtype=bool)
+        # Summed-area table of the allocated rows, table[i, j] being the number of occupied cells in rows < i and columns < j
+        self.table = np.zeros((1, width + 1), dtype=np.int32)
+        # Every row above it is full
+        self.first_open_row = 0
+
+    def grow(self, height):
+        # Rows are allocated by doubling so that growing one kernel at a time stays cheap
+        if height > len(self.occupied):
+            capacity = max(height, 2 * len(self.occupied))
+            occupied = np.zeros((capacity, self.width), dtype=bool)
+            occupied[:len(self.occupied)] = self.occupied
+            self.occupied = occupied
+            # New rows are free, so their table rows repeat the last one
+            table = np.empty((capacity + 1, self.width + 1), dtype=np.int32)
+            table[:len(self.table)] = self.table
+            table[len(self.table):] = self.table[-1]
+            self.table = table
+        self.height = max(self.height, height)
+
+    def fill(self, row, col, shape):
+        # The table only changes below and right of the filled cells, by the prefix counts of the newly occupied ones
+        region = self.occupied[row:row + shape[0], col:col + shape[1]]
+        added = (~region).cumsum(axis=0, dtype=np.int32).cumsum(axis=1)
+        region[...] = True
+        height, width = added.shape
+        if added.size:
+            self.table[row + 1:row + height + 1, col + 1:col + width + 1] += added
+            self.table[row + 1:row + height + 1, col + width + 1:] += added[:, -1:]
+            self.table[row + height + 1:, col + 1:col + width + 1] += added[-1]
+            self.table[row + height + 1:, col + width + 1:] += added[-1, -1]
+        while self.first_open_row < self.height and self.occupied[self.first_open_row].all():
+            self.first_open_row += 1
+
+    def first_fit(self, shape):
+        # First free position of the shape in row-major order, found with the summed-area table of the occupied cells
+        height, width = shape
+        if height > self.height or width > self.width:
+            return None
+        table = self.table
+        last_row = self.height - height
+        for first in range(self.first_open_row, last_row + 1, self.row_block):
+            end = min(first + self.row_block, last_row + 1)
+            top, bottom = table[first:end], table[first + height:end + height]
+            free = (bottom[:, width:] - top[:, width:] - bottom[:, :-width] + top[:, :-width]) == 0
+            position = int(np.argmax(free))
+            if free.flat[position]:
+                row, col = divmod(position, free.shape[1])
+                return first + row, col
+        return None
+
+    def used_height(self):
+        return int(self.occupied[:self.height].any(axis=1).sum())
+
 class Cluster_list():
     def __init__(self):
         self.clusters = {}
\ No newline at end of file
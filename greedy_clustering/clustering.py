@@ -1,8 +1,7 @@
+import bisect
 import numpy as np
-import copy
 from utils import *
 from data_structures import Cluster, Cluster_list
-import common as common
 
 class Clustering():
     def __init__():
@@ -39,41 +38,43 @@ def check_conflict_slice_vs_slices(slice1, slices):
 
     return any(check_conflict(slice1[0], slice1[1], slice2.slice[0], slice2.slice[1]) for slice2 in slices), slice1
 
-def find_max_nonoverlapping_set(slice1, slice2):
+def find_max_nonoverlapping_set(context, slice1, slice2):
     """
     Finds the maximum set of non-overlapping slices from two lists of slices.
-    This function takes two lists of slices, combines them, and then finds the 
-    maximum set of non-overlapping slices. Each slice is assumed to have a 
-    'slice' attribute which is a tuple where the first element is the start 
-    time and the second element is the end time.
+    This function takes two arrays of slice rows of the current timing data, combines them,
+    and then finds the maximum set of non-overlapping slices.
     Args:
-        slice1 (list): The first list of slices.
-        slice2 (list): The second list of slices.
+        context (Run_Context): The context of the run, holding the current timing data.
+        slice1 (np.ndarray): Row indices of the first list of slices.
+        slice2 (np.ndarray): Row indices of the second list of slices.
     Returns:
-        list: A list of slices that form the maximum set of non-overlapping slices.
+        np.ndarray: Row indices of the slices that form the maximum set of non-overlapping slices.
     """
     
-    slices = sorted(slice1 + slice2, key=lambda x: x.slice[1])
-    if not slices:
+    slices = np.concatenate((slice1, slice2))
+    if not len(slices):
         print("Error: No slices provided.")
         exit()
-    non_overlapping_set = [slices[0]]
-    last_end_time = slices[0].slice[1]
-    for slice in slices[1:]:
-        if slice.slice[0] >= last_end_time:
-            non_overlapping_set.append(slice)
-            last_end_time = slice.slice[1]
-    return non_overlapping_set
-
-def check_overlap_within_personality(kernel_timing_data):
+    slices = slices[np.argsort(context.timing_data.end[slices], kind="stable")]
+    starts = context.timing_data.start[slices].tolist()
+    ends = context.timing_data.end[slices].tolist()
+    non_overlapping_set = [0]
+    last_end_time = ends[0]
+    for idx in range(1, len(slices)):
+        if starts[idx] >= last_end_time:
+            non_overlapping_set.append(idx)
+            last_end_time = ends[idx]
+    return slices[non_overlapping_set]
+
+def check_overlap_within_personality(context, kernel_timing_data):
     """
     Check for overlapping slices within a given personality's kernel timing data.
     This function iterates through a list of kernel timing data slices and identifies
     non-overlapping slices. It returns a list of these non-overlapping slices and their
     corresponding indices in the original list.
     Args:
-        kernel_timing_data (list): A list of objects where each object has a 'slice' attribute.
-                                   The 'slice' attribute is a tuple containing start and end times.
+        context (Run_Context): The context of the run, holding the current timing data.
+        kernel_timing_data (np.ndarray): Row indices of the kernel's slices in the current timing data, sorted by start time.
     Returns:
         tuple: A tuple containing:
             - non_overlapping_slices (list): A list of non-overlapping slices.
@@ -81,20 +82,21 @@ def check_overlap_within_personality(kernel_timing_data):
     """
     
     
-    if not kernel_timing_data:
+    if not len(kernel_timing_data):
         print("Error: No kernel timing data provided.")
         exit()
 
-    non_overlapping_slices = [kernel_timing_data[0]]
+    starts = context.timing_data.start[kernel_timing_data].tolist()
+    ends = context.timing_data.end[kernel_timing_data].tolist()
     remove_indices = [0]
-    last_end_time = kernel_timing_data[0].slice[1]
+    last_end_time = ends[0]
     
-    for idx, slice in enumerate(kernel_timing_data[1:], start=1):
-        if slice.slice[0] >= last_end_time:
-            non_overlapping_slices.append(slice)
-            last_end_time = slice.slice[1]
+    for idx in range(1, len(starts)):
+        if starts[idx] >= last_end_time:
+            last_end_time = ends[idx]
             remove_indices.append(idx)
     
+    non_overlapping_slices = context.timing_data.slices(kernel_timing_data[remove_indices])
     return non_overlapping_slices, remove_indices
 
 def has_duplicates(lst):
@@ -109,70 +111,123 @@ def has_duplicates(lst):
     """
     return len(lst) != len(set(lst))
  
-def get_new_max_nonoverlapping_set():
+def count_max_nonoverlapping(starts, ends):
     """
-    Computes the maximum non-overlapping sets of timing data and the number of overlaps for each person.
+    Counts the maximum set of non-overlapping intervals, picked greedily by earliest end as in find_max_nonoverlapping_set.
 
-    This function iterates through pairs of timing data entries, finds the maximum non-overlapping set for each pair,
-    and updates the count of overlaps for each person involved. It returns a dictionary of these sets and a dictionary
-    of the number of overlaps for each person.
+    Args:
+        starts (list): The starts of the intervals, sorted by their ends.
+        ends (list): The ends of the intervals, sorted.
 
     Returns:
-        tuple: A tuple containing:
-            - max_nonoverlapping_sets (dict): A dictionary where keys are pairs of timing data keys (formatted as "key1-key2")
-              and values are the corresponding maximum non-overlapping sets.
-            - non_overlaps_ranking (dict): A dictionary where keys are timing data keys and values are the number
-              of overlaps for each person.
-    """
-    max_nonoverlapping_sets = {}
-    non_overlaps_ranking = {key: 0 for key in common.timing_data.data}
-    already_covered = set()
-
-    for key1, value1 in common.timing_data.data.items():
-        already_covered.add(key1)
-        for key2, value2 in common.timing_data.data.items():
-            if key2 in already_covered:
+        int: The size of the maximum set of non-overlapping intervals.
+    """
+    count = 1
+    last_end_time = ends[0]
+    for idx in range(1, len(starts)):
+        if starts[idx] >= last_end_time:
+            count += 1
+            last_end_time = ends[idx]
+    return count
+
+def get_new_max_nonoverlapping_set(context):
+    """
+    Ranks the remaining kernels by the sizes of the maximum non-overlapping sets they form with every other kernel.
+
+    The scores of all kernel pairs are kept in the K x K matrix context.pair_scores. Only the pairs of the kernels
+    whose remaining slices changed since the last ranking are scored again, from the intervals of each kernel sorted
+    by end once, so that ranking a new bin costs time in the kernels the previous bin consumed.
+
+    Args:
+        context (Run_Context): The context of the run, holding the remaining timing data.
+
+    Returns:
+        dict: Kernel name -> the sum of the sizes of the maximum non-overlapping sets it forms with every other kernel,
+              a pair counting only when its set is smaller than both kernels, in the order of the timing data.
+    """
+    kernel_codes = {key: code for code, key in enumerate(context.timing_data.kernel_names)}
+    if context.pair_scores is None or len(context.pair_scores) != len(kernel_codes):
+        context.pair_scores = np.zeros((len(kernel_codes), len(kernel_codes)), dtype=np.int64)
+        context.pair_score_intervals = {}
+
+    # Remaining slices of a kernel are replaced, never changed in place, so a kernel changed if its array is another one
+    changed = []
+    for key, value in context.timing_data.data.items():
+        if key not in context.pair_score_intervals or context.pair_score_intervals[key][0] is not value:
+            order = np.argsort(context.timing_data.end[value], kind="stable")
+            context.pair_score_intervals[key] = (value, context.timing_data.start[value][order], context.timing_data.end[value][order])
+            changed.append(key)
+
+    scored = set()
+    for key1 in changed:
+        scored.add(key1)
+        value1, starts1, ends1 = context.pair_score_intervals[key1]
+        for key2 in context.timing_data.data:
+            if key2 in scored:
                 continue
-            max_nonoverlapping_set = find_max_nonoverlapping_set(value1, value2)
-            if len(max_nonoverlapping_set) not in (len(value1), len(value2)):
-                max_nonoverlapping_sets[f"{key1}-{key2}"] = max_nonoverlapping_set
-                non_overlaps_ranking[key1] += len(max_nonoverlapping_set)
-                non_overlaps_ranking[key2] += len(max_nonoverlapping_set)
-    return non_overlaps_ranking
+            value2, starts2, ends2 = context.pair_score_intervals[key2]
+            ends = np.concatenate((ends1, ends2))
+            order = np.argsort(ends, kind="stable")
+            count = count_max_nonoverlapping(np.concatenate((starts1, starts2))[order].tolist(), ends[order].tolist())
+            score = count if count not in (len(value1), len(value2)) else 0
+            context.pair_scores[kernel_codes[key1], kernel_codes[key2]] = score
+            context.pair_scores[kernel_codes[key2], kernel_codes[key1]] = score
+            context.profile.count("pair_scores_computed", 1)
 
-def check_overlap_of_bin_with_others(cluster):
+    codes = [kernel_codes[key] for key in context.timing_data.data]
+    non_overlaps_ranking = context.pair_scores[np.ix_(codes, codes)].sum(axis=1)
+    return dict(zip(context.timing_data.data, non_overlaps_ranking.tolist()))
+
+def check_overlap_of_bin_with_others(context, cluster):
     """
     Checks for overlaps between a given bin and other clusters in the timing data.
+    The remaining slices of all candidate kernels are screened against the sorted
+    intervals of the cluster in a single vectorized pass.
 
     Args:
-        bin (tuple): A tuple where the first element is the bin identifier and the second element is the bin slice.
+        context (Run_Context): The context of the run, holding the remaining timing data.
+        cluster (Cluster): The cluster whose slices are compared against the remaining timing data.
 
     Returns:
-        dict: A dictionary where the keys are items from the timing data and the values are lists of slices that do not overlap with the given bin slice.
+        tuple: A tuple containing:
+            - candidate_masks (dict): Kernel name -> boolean mask over its remaining slices, True where the slice does not overlap with the cluster.
+            - candidate_counts (dict): Kernel name -> number of its slices that do not overlap with the cluster.
     """
-    if not common.timing_data.data:
-        print("Error: No timing data provided.")
-        return {}
+    if not context.timing_data.data:
+        # The seed of the cluster took the last remaining slices
+        return {}, {}
 
     if not cluster.slices:
         print("Error: Bin slices are not initialized.")
-        return {}
+        return {}, {}
+
+    kernels = [
+        item for item in context.timing_data.data
+        # if item not in cluster.kernels and (not context.ED_kurtosis_mode or item == "Kurtosis_0" or item == "ED8_atn_0")
+        if item not in cluster.kernels and (not context.ED_kurtosis_mode or item == "Kurtosis_0")
+    ]
+    if not kernels:
+        return {}, {}
 
-    non_overlaps = {
-        item: [compared_slice for compared_slice in value if not check_conflict_slice_vs_slices(compared_slice.slice, cluster.slices)[0]]
-        for item, value in common.timing_data.data.items()
-        # if item not in cluster.kernels and (not common.ED_kurtosis_mode or item == "Kurtosis_0" or item == "ED8_atn_0")
-        if item not in cluster.kernels and (not common.ED_kurtosis_mode or item == "Kurtosis_0")
-    }
-    return non_overlaps
+    rows = np.concatenate([context.timing_data.data[item] for item in kernels])
+    context.profile.count("conflict_checks", len(rows))
+    non_overlap = ~cluster.conflicts(context.timing_data.start[rows], context.timing_data.end[rows])
+    boundaries = np.cumsum([len(context.timing_data.data[item]) for item in kernels])[:-1]
 
-def check_overlap_of_bin_with_others_only_one(cluster, slices):
+    candidate_masks = dict(zip(kernels, np.split(non_overlap, boundaries)))
+    candidate_counts = {item: int(np.count_nonzero(mask)) for item, mask in candidate_masks.items()}
+    return candidate_masks, candidate_counts
+
+def check_overlap_of_bin_with_others_only_one(context, cluster, slices, candidate_mask=None):
     """
     Check for overlaps between a given cluster and a list of slices, and update the cluster with non-overlapping slices.
 
     Args:
+        context (Run_Context): The context of the run, holding the current timing data.
         cluster (tuple): A tuple where the first element is the cluster identifier and the second element is a list of slices in the cluster.
-        slices (list): A list of slices to be checked for overlap with the cluster's slices.
+        slices (np.ndarray): Row indices of the slices to be checked for overlap with the cluster's slices.
+        candidate_mask (np.ndarray, optional): Result of an earlier screening of the slices against the cluster.
+            Slices already known to overlap with the cluster are skipped. Defaults to None.
 
     Returns:
         tuple: A tuple containing:
@@ -181,13 +236,15 @@ def check_overlap_of_bin_with_others_only_one(cluster, slices):
             - list: List of indices of the slices that were added to the cluster.
     """
     non_overlap, remove_list = [], []
-    new_cluster_slices = copy.deepcopy(cluster.slices) 
-    for idx, compared_slice in enumerate(slices):
-        if not check_conflict_slice_vs_slices(compared_slice.slice, new_cluster_slices)[0]:
-            new_cluster_slices.append(compared_slice)
+    candidates = np.flatnonzero(candidate_mask) if candidate_mask is not None else np.arange(len(slices))
+    intervals = zip(context.timing_data.start[slices[candidates]].tolist(), context.timing_data.end[slices[candidates]].tolist())
+    context.profile.count("conflict_checks", len(candidates))
+    for idx, interval in zip(candidates.tolist(), intervals):
+        if not cluster.has_conflict(interval):
+            compared_slice = context.timing_data.slice(slices[idx])
+            cluster.add_slice(compared_slice)
             non_overlap.append(compared_slice)
             remove_list.append(idx)
-    cluster.slices = new_cluster_slices  
     return cluster.slices, non_overlap, remove_list
 
 def check_overlap_v2(interval1, interval2):
@@ -205,46 +262,103 @@ def check_overlap_v2(interval1, interval2):
 
 def find_overlaps_for_bin(data):
     """
-    Identifies overlapping items within a given dataset.
+    Identifies overlapping items within a given dataset with a sort-and-sweep pass.
+    The items are sorted by start time and each item is compared against the item
+    with the latest end time seen so far, which takes O(n log n) instead of comparing every pair.
 
     Args:
         data (list): A list of items to be checked for overlaps. Each item should be compatible with the check_overlap_v2 function.
 
     Returns:
         list: A list of tuples, where each tuple contains two items from the input data that overlap.
+              Every item that overlaps with an item starting before it is reported once, paired with
+              the earlier item that reaches furthest.
+    """
+    if not data:
+        return []
+
+    intervals = [item.slice for item in data]
+    order = sorted(range(len(data)), key=lambda idx: intervals[idx])
+
+    overlaps = []
+    furthest = order[0]
+    for idx in order[1:]:
+        if intervals[idx][0] < intervals[furthest][1] and check_overlap_v2(data[furthest], data[idx]):
+            overlaps.append((data[furthest], data[idx]))
+        if intervals[idx][1] > intervals[furthest][1]:
+            furthest = idx
+    return overlaps
+
+def should_validate(context, bin_id):
+    """
+    Decides whether a bin is checked for overlaps, based on the validation level in context.config.validation.
+
+    Args:
+        context (Run_Context): The context of the run.
+        bin_id (int): The identifier of the bin.
+
+    Returns:
+        bool: True for every bin with 'full' validation, for every context.config.validation_sampling_period'th bin
+              with 'sampled' validation, and never with validation 'off'.
+    """
+    if context.config.validation == "full":
+        return True
+    if context.config.validation == "sampled":
+        return int(bin_id) % context.config.validation_sampling_period == 0
+    return False
+
+def validate_bin(context, bin_id, slices):
     """
-    return [(data[i], data[j]) for i in range(len(data)) for j in range(i + 1, len(data)) if check_overlap_v2(data[i], data[j])]
+    Checks that no two slices of a bin overlap and exits with the overlapping pairs otherwise.
+
+    Args:
+        context (Run_Context): The context of the run.
+        bin_id (int): The identifier of the bin.
+        slices (list): The slices of the bin.
+
+    Raises:
+        SystemExit: If two slices of the bin overlap.
+    """
+    if not should_validate(context, bin_id):
+        return
+
+    overlaps = find_overlaps_for_bin(slices)
+    if overlaps:
+        print("There are overlaps!!!!", bin_id)
+        for slice1, slice2 in overlaps:
+            print(slice1, "overlaps with", slice2)
+        exit()
 
-def fill_bin_with_overlaps(clusters, bin_id, personality_dict, mode=None):
+def fill_bin_with_overlaps(context, clusters, bin_id, personality_dict, mode=None):
     """
     Fills a bin with non-overlapping items based on certain criteria and updates the bin and the global data structure.
     Args:
+        context (Run_Context): The context of the run, whose remaining timing data is consumed.
         clusters (list): A list of clusters where each bin is a list containing items and their associated data.
         bin_id (int): The index of the bin to be filled.
         personality_dict (dict): A dictionary containing personality data for each item.
         mode (str, optional): An optional mode parameter that affects the overlap checking process.
     Raises:
         SystemExit: If there are duplicates in the remove list or if overlaps are found in the bin after processing.
+                    The bin is checked according to the validation level in context.config.validation.
     Notes:
         - The function first checks for overlaps using the `check_overlap_of_bin_with_others` function.
-        - It sorts the non-overlapping items based on the length of their overlap lists in descending order.
-        - It filters items based on a size ratio if the `common.homogeneous` flag is set.
+        - It sorts the items based on the number of their non-overlapping slices in descending order.
+        - It filters items based on a size ratio if the `context.config.homogeneous` flag is set.
         - It updates the bin with non-overlapping items and removes processed items from the global data structure.
         - It ensures there are no duplicates in the remove list and no overlaps in the final bin.
     """
-    non_overlaps = check_overlap_of_bin_with_others(clusters[bin_id])
-    sorted_non_overlaps = dict(sorted(non_overlaps.items(), key=lambda item: len(item[1]), reverse=True))
+    candidate_masks, candidate_counts = check_overlap_of_bin_with_others(context, clusters[bin_id])
+    sorted_non_overlaps = dict(sorted(candidate_counts.items(), key=lambda item: item[1], reverse=True))
 
     remove_dict = {}
     for item in sorted_non_overlaps:
-        # if common.homogeneous and "energy" not in item and "Kurtosis" not in item and "ED8_atn_0" not in item:
-        if common.homogeneous and "energy" not in item and "Kurtosis" not in item:
-            seed_size = personality_dict[clusters[bin_id].seed_kernel][0][0] * personality_dict[clusters[bin_id].seed_kernel][0][1]
-            current_kernel_size = personality_dict[item][0][0] * personality_dict[item][0][1]
-            if not (0.5 <= seed_size / current_kernel_size <= 2.0):
+        # if context.config.homogeneous and "energy" not in item and "Kurtosis" not in item and "ED8_atn_0" not in item:
+        if context.config.homogeneous and "energy" not in item and "Kurtosis" not in item:
+            if item not in context.kernel_registry.shape_compatible[clusters[bin_id].seed_kernel]:
                 continue
 
-        non_overlap_bin, non_overlap_list, remove_list = check_overlap_of_bin_with_others_only_one(clusters[bin_id], common.timing_data.data[item])
+        non_overlap_bin, non_overlap_list, remove_list = check_overlap_of_bin_with_others_only_one(context, clusters[bin_id], context.timing_data.data[item], candidate_masks[item])
         if non_overlap_list:
             clusters[bin_id].extend_kernels([item])
             clusters[bin_id].slices = non_overlap_bin
@@ -254,24 +368,20 @@ def fill_bin_with_overlaps(clusters, bin_id, personality_dict, mode=None):
         if has_duplicates(remove_list):
             print("Remove list has duplicates!!", remove_list)
             exit()
-        common.timing_data.data[key] = [slice for idx, slice in enumerate(common.timing_data.data[key]) if idx not in remove_list]
-
-    overlaps = find_overlaps_for_bin(clusters[bin_id].slices)
-    if overlaps:
-        print("There are overlaps!!!!", bin_id)
-        exit()
+        context.timing_data.data.consume(key, remove_list)
 
-    common.timing_data.data = {k: v for k, v in common.timing_data.data.items() if v}
+    validate_bin(context, bin_id, clusters[bin_id].slices)
 
-def put_highest_ranked_pers_to_bin(clusters, bin_id):
+def put_highest_ranked_pers_to_bin(context, clusters, bin_id):
     """
     Places the highest ranked personality into a specified bin.
 
     This function either places the personality with the highest energy detection kurtosis 
     or the personality with the maximum non-overlapping sets into the specified bin. 
-    The selection is based on the `common.ED_kurtosis_mode` flag.
+    The selection is based on the `context.ED_kurtosis_mode` flag.
 
     Args:
+        context (Run_Context): The context of the run, whose remaining timing data is consumed.
         clusters (dict): A dictionary where the key is the bin ID and the value is a list containing 
                      the personality and its non-overlapping slices.
         bin_id (int): The ID of the bin where the personality will be placed.
@@ -280,22 +390,22 @@ def put_highest_ranked_pers_to_bin(clusters, bin_id):
     Returns:
         None
     """
-    if common.ED_kurtosis_mode:
+    if context.ED_kurtosis_mode:
         key = "energy_detect1_0"
-        non_overlapping_slices, remove_indices = check_overlap_within_personality(common.timing_data.data[key])
+        non_overlapping_slices, remove_indices = check_overlap_within_personality(context, context.timing_data.data[key])
         clusters[bin_id] = Cluster(id=bin_id, kernels=[key], slices=non_overlapping_slices, IMEM_layer=0, seed_kernel=key)
-        common.timing_data.data[key] = [slice for idx, slice in enumerate(common.timing_data.data[key]) if idx not in remove_indices]
+        context.timing_data.data.consume(key, remove_indices)
         
     else:
-        non_overlaps_ranking = get_new_max_nonoverlapping_set()
+        non_overlaps_ranking = get_new_max_nonoverlapping_set(context)
         sorted_non_overlaps_ranking = dict(sorted(non_overlaps_ranking.items(), key=lambda item: item[1], reverse=True))
 
         key = list(sorted_non_overlaps_ranking.keys())[0]
-        non_overlapping_slices, remove_indices = check_overlap_within_personality(common.timing_data.data[key])
+        non_overlapping_slices, remove_indices = check_overlap_within_personality(context, context.timing_data.data[key])
         clusters[bin_id] = Cluster(id=bin_id, kernels=[key], slices=non_overlapping_slices, IMEM_layer=0, seed_kernel=key)
-        common.timing_data.data[key] = [slice for idx, slice in enumerate(common.timing_data.data[key]) if idx not in remove_indices]
+        context.timing_data.data.consume(key, remove_indices)
 
-def unlimited_IMEM_binning(personality_dict, clusters, bin_id, mode=None):
+def unlimited_IMEM_binning(context, personality_dict, clusters, bin_id, mode=None):
     """
     Organizes personalities into clusters based on overlap and ranking criteria.
     This function attempts to bin personalities from `personality_dict` into `clusters` 
@@ -303,6 +413,8 @@ def unlimited_IMEM_binning(personality_dict, clusters, bin_id, mode=None):
     overlap within each bin. The function operates in two modes: 'ed_kurtosis' mode 
     and a default mode.
     Parameters:
+    context (Run_Context): The context of the run, whose remaining timing data is consumed and whose
+                           ED_kurtosis_mode is cleared once the ED and Kurtosis slices are exhausted.
     personality_dict (dict): Dictionary containing personality data.
     clusters (dict): Dictionary where the keys are bin IDs and the values are lists of 
                  personalities assigned to each bin.
@@ -314,32 +426,112 @@ def unlimited_IMEM_binning(personality_dict, clusters, bin_id, mode=None):
     tuple: A tuple containing the updated clusters, the next bin ID, and the mode used 
            ('ed_kurtosis' or None).
     """
-    if common.ED_kurtosis_mode:
-        while "energy_detect1_0" in common.timing_data.data and "Kurtosis_0" in common.timing_data.data:
-            put_highest_ranked_pers_to_bin(clusters, bin_id)
-            fill_bin_with_overlaps(clusters, bin_id, common.personality_dict)
-            if "energy_detect1_0" not in common.timing_data.data and "Kurtosis_0" in common.timing_data.data:
+    if context.ED_kurtosis_mode:
+        while "energy_detect1_0" in context.timing_data.data and "Kurtosis_0" in context.timing_data.data:
+            put_highest_ranked_pers_to_bin(context, clusters, bin_id)
+            fill_bin_with_overlaps(context, clusters, bin_id, context.personality_dict)
+            if "energy_detect1_0" not in context.timing_data.data and "Kurtosis_0" in context.timing_data.data:
                 key = "Kurtosis_0"
-                if common.timing_data.data[key]:
-                    non_overlapping_slices, remove_indices = check_overlap_within_personality(common.timing_data.data[key])
+                if len(context.timing_data.data[key]):
+                    non_overlapping_slices, remove_indices = check_overlap_within_personality(context, context.timing_data.data[key])
                     bin_id += 1
                     clusters[bin_id] = Cluster(id=bin_id, kernels=[key], slices=non_overlapping_slices, IMEM_layer=0, seed_kernel=key)
-                    common.timing_data.data[key] = [slice for idx, slice in enumerate(common.timing_data.data[key]) if idx not in remove_indices]
-            common.ED_kurtosis_mode = "ed_kurtosis"
+                    context.timing_data.data.consume(key, remove_indices)
+            context.ED_kurtosis_mode = "ed_kurtosis"
             return clusters, bin_id + 1
-        common.timing_data.data.pop("Kurtosis_0", None)
-        common.ED_kurtosis_mode = None
+        context.timing_data.data.pop("Kurtosis_0", None)
+        context.ED_kurtosis_mode = None
         return clusters, bin_id
     else:
-        put_highest_ranked_pers_to_bin(clusters, bin_id)
-        fill_bin_with_overlaps(clusters, bin_id, personality_dict)
-        common.ED_kurtosis_mode = None
+        put_highest_ranked_pers_to_bin(context, clusters, bin_id)
+        fill_bin_with_overlaps(context, clusters, bin_id, personality_dict)
+        context.ED_kurtosis_mode = None
         return clusters, bin_id + 1
 
-def bin_redistribution(clusters, bin_id, personality_dict, IMEM_size):
+def bin_redistribution_sweep(context, clusters, bin_id, personality_dict, IMEM_sizes):
+    """
+    Redistributes items in bins for every given IMEM size with a single traversal of the clusters.
+    The slices of each cluster are grouped by kernel and the kernel sizes are accumulated into
+    prefix sums once. For each IMEM size, an oversized bin keeps the longest suffix of its kernels
+    that fits and moves the remaining prefix to a new bin, and the split point is found by bisection
+    on the prefix sums. The bins are the same as the ones of repeated bin_redistribution calls.
+    Args:
+        context (Run_Context): The context of the run.
+        clusters (dict): A dictionary of the unlimited IMEM clusters.
+        bin_id (int): The starting bin ID.
+        personality_dict (dict): A dictionary where keys are item identifiers and values are tuples containing item properties.
+        IMEM_sizes (list): The maximum allowed sizes for each bin.
+    Returns:
+        dict: A dictionary where each key is an IMEM size and the value is the dictionary of the redistributed bins for it,
+              in the format returned by bin_redistribution.
+    Raises:
+        SystemExit: If a single item is bigger than one of the IMEM sizes.
+    """
+    cluster_layouts = build_cluster_layouts(clusters, personality_dict)
+
+    IMEM_bins = {}
+    for IMEM_size in IMEM_sizes:
+        with context.profile.stage("redistribution", IMEM_size):
+            IMEM_bins[IMEM_size] = redistribute_layouts(context, cluster_layouts, bin_id, IMEM_size)
+
+    return IMEM_bins
+
+def build_cluster_layouts(clusters, personality_dict):
+    # The slices of each cluster grouped by kernel, and the prefix sums of its kernel sizes, which do not depend on the IMEM size
+    cluster_layouts = []
+    for key, cluster in clusters.items():
+        kernel_slices = {kernel: [] for kernel in cluster.kernels}
+        for time_slice in cluster.slices:
+            kernel_slices[time_slice.kernel_name].append(time_slice)
+        prefix_sizes = [0]
+        for kernel in cluster.kernels:
+            prefix_sizes.append(prefix_sizes[-1] + personality_dict[kernel][1])
+        cluster_layouts.append((key, cluster, kernel_slices, prefix_sizes))
+    return cluster_layouts
+
+def redistribute_layouts(context, cluster_layouts, bin_id, IMEM_size):
+    # Redistribution of the cluster layouts of bin_redistribution_sweep for one IMEM size
+    # Bins are processed in order and new bins are appended to the end, each bin being a kernel range of a cluster
+    queue = [(layout[0], layout, 0, len(layout[1].kernels)) for layout in cluster_layouts]
+    new_bin_id = bin_id
+    chunks = {}
+    position = 0
+    while position < len(queue):
+        key, layout, first, end = queue[position]
+        position += 1
+        prefix_sizes = layout[3]
+        if prefix_sizes[end] - prefix_sizes[first] > IMEM_size:
+            split = bisect.bisect_left(prefix_sizes, prefix_sizes[end] - IMEM_size, first + 1, end + 1)
+            if split == end:
+                print("Kernel", layout[1].kernels[end - 1], "does not fit into an IMEM of size", IMEM_size, "!!!")
+                exit()
+            queue.append((new_bin_id, layout, first, split))
+            new_bin_id += 1
+            first = split
+        chunks[key] = (layout, first, end)
+    context.profile.count("redistribution_bins_created", new_bin_id - bin_id, IMEM_size)
+
+    bins = {}
+    for key, (layout, first, end) in chunks.items():
+        original_key, cluster, kernel_slices, prefix_sizes = layout
+        kernels = cluster.kernels[first:end]
+        if key != original_key:
+            slices = [time_slice for kernel in kernels for time_slice in kernel_slices[kernel]]
+            context.profile.observe("slices_moved_per_bin", len(slices))
+            context.profile.count("slices_moved", len(slices), IMEM_size)
+        elif first == 0:
+            slices = list(cluster.slices)
+        else:
+            remaining_kernels = set(kernels)
+            slices = [time_slice for time_slice in cluster.slices if time_slice.kernel_name in remaining_kernels]
+        bins[key] = [kernels, slices, prefix_sizes[end] - prefix_sizes[first]]
+    return bins
+
+def bin_redistribution(context, clusters, bin_id, personality_dict, IMEM_size):
     """
     Redistributes items in bins to ensure that the size of each bin does not exceed the given IMEM size.
     Args:
+        context (Run_Context): The context of the run.
         bin_id (int): The starting bin ID.
         personality_dict (dict): A dictionary where keys are item identifiers and values are tuples containing item properties.
         IMEM_size (int): The maximum allowed size for each bin.
@@ -349,34 +541,9 @@ def bin_redistribution(clusters, bin_id, personality_dict, IMEM_size):
               - A list of time slices associated with the items in the bin.
               - The total size of the items in the bin.
     """
-    copy_bins = {k: [v.kernels, v.slices, sum(personality_dict[item][1] for item in v.kernels)] for k, v in copy.deepcopy(clusters).items()}
-    bin_id -= 1
-
-    while True:
-        for item, value in copy_bins.items():
-            bin_size = value[2] 
-            if bin_size <= IMEM_size:
-                continue
-            else:
-                bin_id += 1
-                copy_bins[bin_id] = [[], [], 0]
-                while bin_size > IMEM_size:
-                    remove_list = [idx for idx, time_slice in enumerate(value[1]) if time_slice.kernel_name == value[0][0]]
-                    copy_bins[bin_id][0].append(value[0].pop(0))
-                    copy_bins[bin_id][1].extend(value[1][i] for i in remove_list)
-                    copy_bins[bin_id][2] += personality_dict[copy_bins[bin_id][0][-1]][1]
-                    value[2] -= personality_dict[copy_bins[bin_id][0][-1]][1]
-                    value[1] = [time_slice for idx, time_slice in enumerate(value[1]) if idx not in remove_list]
-                    bin_size = value[2]
-            
-            break
-
-        if all(value[2] <= IMEM_size for value in copy_bins.values()):
-            break
-    
-    return copy_bins
+    return bin_redistribution_sweep(context, clusters, bin_id, personality_dict, [IMEM_size])[IMEM_size]
 
-def main_binning():
+def main_binning(context):
     """
     Perform the main binning process using unlimited IMEM binning.
     This function initializes the binning process by setting up the initial
@@ -384,51 +551,89 @@ def main_binning():
     lengths of timing data. It then iteratively processes the timing data
     using the `unlimited_IMEM_binning` function until all timing data has
     been binned.
+    Args:
+        context (Run_Context): The context of the run, whose timing_data holds the slices of the array. They are all consumed.
     Returns:
         tuple: A tuple containing:
             - bins (dict): The dictionary containing the binned data.
             - bin_id (int): The final bin ID after processing.
             - bsum (int): The total sum of lengths of timing data.
     """
-    bin_id, clusters, bsum = 0, Cluster_list().clusters, sum(len(value) for value in common.timing_data.data.values())
-    while common.timing_data.data:
-        clusters, bin_id = unlimited_IMEM_binning(common.personality_dict, clusters, bin_id, common.ED_kurtosis_mode)
+    # Every array is clustered from the configured mode, which the clustering clears as it goes
+    context.ED_kurtosis_mode = context.config.ED_kurtosis_mode
+    bin_id, clusters, bsum = 0, Cluster_list().clusters, sum(len(value) for value in context.timing_data.data.values())
+    while context.timing_data.data:
+        clusters, bin_id = unlimited_IMEM_binning(context, context.personality_dict, clusters, bin_id, context.ED_kurtosis_mode)
     
     return clusters, bin_id, bsum
 
-def redistribution(clusters, bin_id, bsum, IMEM_size):
+def check_redistribution(context, bins, bsum):
     """
-    Redistributes bins based on the given bin ID and IMEM size, and performs various checks to ensure the integrity of the binning process.
+    Performs various checks to ensure the integrity of the redistributed bins.
 
     Args:
-        bin_id (int): The identifier for the bin to be redistributed.
+        context (Run_Context): The context of the run.
+        bins (dict): A dictionary representing the redistributed bins.
         bsum (int): The initial sum of time slices before redistribution.
-        IMEM_size (int): The size of the IMEM to be used for redistribution.
-
-    Returns:
-        dict: A dictionary representing the redistributed bins.
 
     Raises:
-        SystemExit: If the sum of time slices after redistribution does not match the initial sum, if there are personalities not assigned to any bin, or if there are overlaps within any bin.
+        SystemExit: If there are personalities not assigned to any bin, or if there are overlaps within any bin.
+                    Bins are checked according to the validation level in context.config.validation.
     """
-    if IMEM_size:
-        bins = bin_redistribution(clusters, bin_id, common.personality_dict, IMEM_size)
-
     asum = sum(len(value[1]) for value in bins.values())
 
     if asum != bsum:
         x = 0
 
-    if common.timing_data.data:
+    if context.timing_data.data:
         print("There are personalities that are not put into a bin!!!")
-        print_dict_len(common.timing_data.data)
+        print_dict_len(context.timing_data.data)
         exit()
 
     for bin, value in bins.items():
-        if find_overlaps_for_bin(value[1]):
-            print("There are overlaps!!!")
-            exit()
+        validate_bin(context, bin, value[1])
 
-    if bsum == asum and not common.timing_data.data:
+    if bsum == asum and not context.timing_data.data:
         x = 0
-    return bins
+
+def redistribution(context, clusters, bin_id, bsum, IMEM_size):
+    """
+    Redistributes bins based on the given bin ID and IMEM size, and performs various checks to ensure the integrity of the binning process.
+
+    Args:
+        context (Run_Context): The context of the run.
+        bin_id (int): The identifier for the bin to be redistributed.
+        bsum (int): The initial sum of time slices before redistribution.
+        IMEM_size (int): The size of the IMEM to be used for redistribution.
+
+    Returns:
+        dict: A dictionary representing the redistributed bins.
+
+    Raises:
+        SystemExit: If the sum of time slices after redistribution does not match the initial sum, if there are personalities not assigned to any bin, or if there are overlaps within any bin.
+                    Bins are checked according to the validation level in context.config.validation.
+    """
+    return redistribution_sweep(context, clusters, bin_id, bsum, [IMEM_size])[IMEM_size]
+
+def redistribution_sweep(context, clusters, bin_id, bsum, IMEM_sizes):
+    """
+    Redistributes bins for every given IMEM size in one pass and checks the integrity of each result.
+
+    Args:
+        context (Run_Context): The context of the run.
+        clusters (dict): A dictionary of the unlimited IMEM clusters.
+        bin_id (int): The identifier for the bin to be redistributed.
+        bsum (int): The initial sum of time slices before redistribution.
+        IMEM_sizes (list): The sizes of the IMEM to be used for redistribution.
+
+    Returns:
+        dict: A dictionary where each key is an IMEM size and the value is the dictionary of the redistributed bins for it.
+
+    Raises:
+        SystemExit: If there are personalities not assigned to any bin, or if there are overlaps within any bin.
+    """
+    IMEM_bins = bin_redistribution_sweep(context, clusters, bin_id, context.personality_dict, IMEM_sizes)
+    for IMEM_size, bins in IMEM_bins.items():
+        with context.profile.stage("redistribution_check", IMEM_size):
+            check_redistribution(context, bins, bsum)
+    return IMEM_bins
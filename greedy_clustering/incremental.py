@@ -0,0 +1,255 @@
+# Online clustering of timing slices that arrive in batches after an array has been clustered
+import bisect
+import numpy as np
+
+from utils import build_timing_data
+from data_structures import Cluster
+
+ED_kurtosis_kernels = ("energy_detect1_0", "Kurtosis_0")
+
+def split_kernel_ranges(prefix_sizes, IMEM_size):
+    """
+    Splits the kernels of a cluster the way redistribute_layouts does: an oversized range keeps the longest
+    suffix of its kernels that fits and its prefix is split again.
+
+    Args:
+        prefix_sizes (list): The prefix sums of the kernel sizes of the cluster.
+        IMEM_size (int): The maximum allowed size for each bin.
+
+    Returns:
+        list: The (first, end) kernel ranges of the bins of the cluster, the one kept by the cluster first.
+
+    Raises:
+        SystemExit: If a single kernel is bigger than the IMEM size.
+    """
+    ranges = []
+    end = len(prefix_sizes) - 1
+    while prefix_sizes[end] - prefix_sizes[0] > IMEM_size:
+        split = bisect.bisect_left(prefix_sizes, prefix_sizes[end] - IMEM_size, 1, end + 1)
+        if split == end:
+            print("Kernel at position", end - 1, "of a cluster does not fit into an IMEM of size", IMEM_size, "!!!")
+            exit()
+        ranges.append((split, end))
+        end = split
+    ranges.append((0, end))
+    return ranges
+
+class Incremental_Clustering():
+    """
+    Clustering of one array that grows with batches of new slices, starting from the unlimited IMEM clusters
+    of main_binning, together with their redistribution for a set of IMEM sizes.
+
+    A new slice goes into the first cluster that already holds its kernel and has no slice overlapping it.
+    Otherwise it joins the first cluster that accepts its kernel, under the same rules as the batch clustering:
+    the PE area ratio of fill_bin_with_overlaps with the seed kernel in homogeneous clustering, and in
+    ED-kurtosis mode clusters of only ED and Kurtosis take no other kernel, while Kurtosis only joins them.
+    A new cluster, seeded by the slice, is opened only when no cluster can take it.
+
+    Candidate clusters are indexed per kernel and conflicts are found with the interval index of each cluster,
+    so a batch costs time in the number of its slices and of the candidate clusters rather than in the number of
+    slices clustered so far. The redistributed bins of a cluster are only rebuilt when the cluster gains a kernel.
+    The bins of the initial clusters are the ones of bin_redistribution_sweep. Bins created later take the next
+    free bin ids, and bins a cluster no longer needs are removed, so the ids of other bins do not change.
+    """
+    def __init__(self, context, clusters, bin_id, IMEM_sizes=None):
+        """
+        Args:
+            context (Run_Context): The context of the run, with the kernel models loaded.
+            clusters (dict): The unlimited IMEM clusters of the array, as returned by main_binning. They are updated in place.
+            bin_id (int): The next bin ID, as returned by main_binning.
+            IMEM_sizes (list, optional): The IMEM sizes whose redistribution is kept up to date. Defaults to context.IMEM_size_list.
+        """
+        self.context = context
+        self.clusters = clusters
+        self.bin_id = bin_id
+        self.IMEM_sizes = list(IMEM_sizes) if IMEM_sizes is not None else list(context.IMEM_size_list)
+        self.ED_kurtosis_mode = context.config.ED_kurtosis_mode
+        self.kernel_names = list(context.personality_dict)
+
+        # Cluster id -> (slices grouped by kernel, prefix sums of the kernel sizes)
+        self.layouts = {}
+        # Kernel -> ids of the clusters holding it, and of the other clusters accepting it, both sorted
+        self.members = {kernel: [] for kernel in self.kernel_names}
+        self.candidates = {kernel: [] for kernel in self.kernel_names}
+        for cluster_id, cluster in clusters.items():
+            self.index_cluster(cluster_id, cluster)
+
+        # IMEM size -> bin id -> [kernels, slices, size], and cluster id -> (ids of its bins, their kernel ranges)
+        self.bins = {IMEM_size: {} for IMEM_size in self.IMEM_sizes}
+        self.cluster_bins = {IMEM_size: {} for IMEM_size in self.IMEM_sizes}
+        self.next_bin_id = {}
+        for IMEM_size in self.IMEM_sizes:
+            self.redistribute_all(IMEM_size)
+
+    def index_cluster(self, cluster_id, cluster):
+        kernel_slices = {kernel: [] for kernel in cluster.kernels}
+        for time_slice in cluster.slices:
+            kernel_slices[time_slice.kernel_name].append(time_slice)
+        prefix_sizes = [0]
+        for kernel in cluster.kernels:
+            prefix_sizes.append(prefix_sizes[-1] + self.context.personality_dict[kernel][1])
+        self.layouts[cluster_id] = (kernel_slices, prefix_sizes)
+
+        for kernel in self.kernel_names:
+            if kernel in kernel_slices:
+                bisect.insort(self.members[kernel], cluster_id)
+            elif self.accepts(cluster, kernel):
+                bisect.insort(self.candidates[kernel], cluster_id)
+
+    def accepts(self, cluster, kernel):
+        # Whether the batch clustering could have added the kernel to the cluster
+        if self.ED_kurtosis_mode:
+            # Clusters of the ED-kurtosis phase only take Kurtosis, which no other cluster takes
+            if set(cluster.kernels) <= set(ED_kurtosis_kernels):
+                return cluster.seed_kernel == "energy_detect1_0" and kernel == "Kurtosis_0"
+            if kernel == "Kurtosis_0":
+                return False
+        if self.context.config.homogeneous and "energy" not in kernel and "Kurtosis" not in kernel:
+            return kernel in self.context.kernel_registry.shape_compatible[cluster.seed_kernel]
+        return True
+
+    def redistribute_all(self, IMEM_size):
+        # Kernel ranges of every cluster, numbered as the queue of redistribute_layouts numbers them: level by level, in cluster order
+        cluster_ranges = {cluster_id: split_kernel_ranges(self.layouts[cluster_id][1], IMEM_size) for cluster_id in self.clusters}
+        bin_ids = {cluster_id: [cluster_id] for cluster_id in self.clusters}
+        next_bin_id = self.bin_id
+        level = 1
+        while any(len(ranges) > level for ranges in cluster_ranges.values()):
+            for cluster_id, ranges in cluster_ranges.items():
+                if len(ranges) > level:
+                    bin_ids[cluster_id].append(next_bin_id)
+                    next_bin_id += 1
+            level += 1
+        self.next_bin_id[IMEM_size] = next_bin_id
+
+        for cluster_id, ranges in cluster_ranges.items():
+            self.set_cluster_bins(IMEM_size, cluster_id, bin_ids[cluster_id], ranges)
+
+    def set_cluster_bins(self, IMEM_size, cluster_id, bin_ids, ranges):
+        cluster = self.clusters[cluster_id]
+        kernel_slices, prefix_sizes = self.layouts[cluster_id]
+        for key, (first, end) in zip(bin_ids, ranges):
+            kernels = cluster.kernels[first:end]
+            if key != cluster_id:
+                slices = [time_slice for kernel in kernels for time_slice in kernel_slices[kernel]]
+            elif first == 0:
+                slices = list(cluster.slices)
+            else:
+                remaining_kernels = set(kernels)
+                slices = [time_slice for time_slice in cluster.slices if time_slice.kernel_name in remaining_kernels]
+            self.bins[IMEM_size][key] = [kernels, slices, prefix_sizes[end] - prefix_sizes[first]]
+        self.cluster_bins[IMEM_size][cluster_id] = (bin_ids, ranges)
+
+    def resplit_cluster(self, IMEM_size, cluster_id, changed_bins):
+        # The cluster keeps its bin ids in order, takes new ones if it needs more bins and frees the ones it no longer needs
+        ranges = split_kernel_ranges(self.layouts[cluster_id][1], IMEM_size)
+        bin_ids = list(self.cluster_bins[IMEM_size].get(cluster_id, ([cluster_id], None))[0])
+        for key in bin_ids[len(ranges):]:
+            del self.bins[IMEM_size][key]
+            changed_bins[key] = None
+        bin_ids = bin_ids[:len(ranges)]
+        while len(bin_ids) < len(ranges):
+            bin_ids.append(self.next_bin_id[IMEM_size])
+            self.next_bin_id[IMEM_size] += 1
+        self.set_cluster_bins(IMEM_size, cluster_id, bin_ids, ranges)
+        for key in bin_ids:
+            changed_bins[key] = self.bins[IMEM_size][key]
+
+    def open_cluster(self, time_slice):
+        # Clusters opened online take ids after the ones of all bins, so that no bin id is reused
+        cluster_id = max([self.bin_id] + list(self.next_bin_id.values()))
+        self.bin_id = cluster_id + 1
+        for IMEM_size in self.IMEM_sizes:
+            self.next_bin_id[IMEM_size] = self.bin_id
+        kernel = time_slice.kernel_name
+        self.clusters[cluster_id] = Cluster(id=cluster_id, kernels=[kernel], slices=[time_slice], IMEM_layer=0, seed_kernel=kernel)
+        self.index_cluster(cluster_id, self.clusters[cluster_id])
+        return cluster_id
+
+    def insert_slice(self, time_slice):
+        """
+        Inserts one slice into the clusters.
+
+        Returns:
+            tuple: The id of the cluster that took the slice, and whether its kernels changed.
+        """
+        kernel = time_slice.kernel_name
+        interval = time_slice.slice
+        self.context.profile.count("conflict_checks", 1)
+        for cluster_id in self.members[kernel]:
+            if not self.clusters[cluster_id].has_conflict(interval):
+                self.clusters[cluster_id].add_slice(time_slice)
+                self.layouts[cluster_id][0][kernel].append(time_slice)
+                return cluster_id, False
+            self.context.profile.count("conflict_checks", 1)
+        for cluster_id in self.candidates[kernel]:
+            cluster = self.clusters[cluster_id]
+            if not cluster.has_conflict(interval):
+                cluster.extend_cluster([kernel], [time_slice])
+                kernel_slices, prefix_sizes = self.layouts[cluster_id]
+                kernel_slices[kernel] = [time_slice]
+                prefix_sizes.append(prefix_sizes[-1] + self.context.personality_dict[kernel][1])
+                self.candidates[kernel].remove(cluster_id)
+                bisect.insort(self.members[kernel], cluster_id)
+                return cluster_id, True
+            self.context.profile.count("conflict_checks", 1)
+        return self.open_cluster(time_slice), True
+
+    def add_timing_data(self, timing_data):
+        """
+        Clusters a batch of new slices and updates the redistributed bins they change.
+
+        Args:
+            timing_data (Timing_Data): The new slices of the array, with the kernel names of the run. The slices of the
+                                       clusters refer to its rows, so it must not be changed afterwards.
+
+        Returns:
+            dict: IMEM size -> bin id -> [kernels, slices, size] of every bin created or changed by the batch,
+                  or None for the bins removed by it.
+        """
+        changed_bins = {IMEM_size: {} for IMEM_size in self.IMEM_sizes}
+        # Clusters that gained a kernel are split again, the slices of the others go to the bins of their kernels
+        resplit_clusters = set()
+        extended_clusters = []
+        with self.context.profile.stage("incremental_clustering"):
+            order = np.lexsort((timing_data.kernel, timing_data.start))
+            for row in order.tolist():
+                time_slice = timing_data.slice(row)
+                cluster_id, new_kernel = self.insert_slice(time_slice)
+                if new_kernel:
+                    resplit_clusters.add(cluster_id)
+                elif cluster_id not in resplit_clusters:
+                    extended_clusters.append((cluster_id, time_slice))
+            self.context.profile.count("incremental_slices", len(order))
+            self.context.profile.count("incremental_clusters_resplit", len(resplit_clusters))
+
+            for IMEM_size in self.IMEM_sizes:
+                for cluster_id, time_slice in extended_clusters:
+                    if cluster_id in resplit_clusters:
+                        continue
+                    bin_ids, ranges = self.cluster_bins[IMEM_size][cluster_id]
+                    position = self.clusters[cluster_id].kernels.index(time_slice.kernel_name)
+                    key = next(key for key, (first, end) in zip(bin_ids, ranges) if first <= position < end)
+                    self.bins[IMEM_size][key][1].append(time_slice)
+                    changed_bins[IMEM_size][key] = self.bins[IMEM_size][key]
+                for cluster_id in sorted(resplit_clusters):
+                    self.resplit_cluster(IMEM_size, cluster_id, changed_bins[IMEM_size])
+        return changed_bins
+
+    def add_records(self, raw_timing_data, array_id):
+        """
+        Clusters a batch of new trace records, in the schema of input_data.json.
+
+        Args:
+            raw_timing_data (dict): Trace key -> list of [start, end, subband, shape, array id] records.
+            array_id (int): The array of the clustering, records of other arrays are ignored.
+
+        Returns:
+            dict: The bins changed by the batch, as returned by add_timing_data.
+        """
+        timing_data = build_timing_data(raw_timing_data, self.context.personality_dict)
+        return self.add_timing_data(timing_data.select(np.flatnonzero(timing_data.array_id == array_id)))
+
+    def redistributed_bins(self, IMEM_size):
+        # Current redistributed bins of an IMEM size, in the format of bin_redistribution
+        return self.bins[IMEM_size]
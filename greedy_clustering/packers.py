@@ -0,0 +1,172 @@
+# Rectangle packers placing clusters on a PE array of fixed width, selected with --packer
+import numpy as np
+
+from data_structures import Occupancy_Grid
+
+# Height of the free space of an array, which grows as needed
+unbounded_height = 1 << 30
+
+class Packer():
+    """
+    Packs kernel rectangles one at a time, in the given order, on an array of fixed width.
+    Subclasses choose the position of each rectangle in find_position.
+    """
+    def __init__(self, width):
+        self.width = width
+        self.grid = Occupancy_Grid(width)
+
+    def place(self, kernel_name, kernel_shape):
+        """
+        Places a kernel on the array.
+
+        Args:
+            kernel_name (str): The name of the kernel to be placed.
+            kernel_shape (tuple): A tuple (kernel_height, kernel_width) representing the shape of the kernel.
+
+        Returns:
+            tuple: Returns (row, col) where the kernel was placed.
+        """
+        if kernel_shape[1] > self.width:
+            # Like first-fit, a kernel wider than the array only adds rows
+            row = self.grid.height
+            self.grid.grow(row + kernel_shape[0])
+            return row, 0
+        row, col = self.find_position(kernel_shape)
+        self.grid.grow(row + kernel_shape[0])
+        self.grid.fill(row, col, kernel_shape)
+        return row, col
+
+    def find_position(self, kernel_shape):
+        raise NotImplementedError
+
+    def used_height(self):
+        return self.grid.used_height()
+
+class First_Fit_Packer(Packer):
+    # First free position in row-major order, growing the array by the height of the kernel when it does not fit
+    def place(self, kernel_name, kernel_shape):
+        position = self.grid.first_fit(kernel_shape)
+        if position is None:
+            self.grid.grow(self.grid.height + kernel_shape[0])
+            position = self.grid.first_fit(kernel_shape)
+            if position is None:
+                return self.grid.height, 0
+        self.grid.fill(position[0], position[1], kernel_shape)
+        return position
+
+class Skyline_Packer(Packer):
+    # Bottom-left placement on the skyline formed by the top of every column
+    def __init__(self, width):
+        super().__init__(width)
+        self.skyline = np.zeros(width, dtype=np.int64)
+
+    def find_position(self, kernel_shape):
+        kernel_height, kernel_width = kernel_shape
+        tops = np.lib.stride_tricks.sliding_window_view(self.skyline, kernel_width).max(axis=1)
+        col = int(np.argmin(tops))
+        row = int(tops[col])
+        self.skyline[col:col + kernel_width] = row + kernel_height
+        return row, col
+
+class MaxRects_Packer(Packer):
+    # MaxRects with best short side fit, keeping every maximal free rectangle as (row, col, height, width)
+    def __init__(self, width):
+        super().__init__(width)
+        self.free_rectangles = [(0, 0, unbounded_height, width)]
+
+    def find_position(self, kernel_shape):
+        kernel_height, kernel_width = kernel_shape
+        best_score = None
+        for free_rectangle in self.free_rectangles:
+            if free_rectangle[2] >= kernel_height and free_rectangle[3] >= kernel_width:
+                score = self.fit_score(free_rectangle, kernel_shape)
+                if best_score is None or score < best_score:
+                    best_score = score
+        row, col = best_score[2], best_score[3]
+        self.split_free_rectangles(row, col, kernel_height, kernel_width)
+        return row, col
+
+    def fit_score(self, free_rectangle, kernel_shape):
+        # Free rectangles are scored within the rows already in use, so that the array only grows when nothing fits in them
+        row, col, height, width = free_rectangle
+        used_height = min(height, self.grid.height - row)
+        if used_height >= kernel_shape[0]:
+            return (0, short_side_fit(used_height, width, kernel_shape), row, col)
+        return (1, (row + kernel_shape[0],), row, col)
+
+    def split_free_rectangles(self, row, col, height, width):
+        free_rectangles = []
+        for free_row, free_col, free_height, free_width in self.free_rectangles:
+            if (row >= free_row + free_height or row + height <= free_row or
+                    col >= free_col + free_width or col + width <= free_col):
+                free_rectangles.append((free_row, free_col, free_height, free_width))
+                continue
+            # Parts of the free rectangle above, below, left and right of the placed one
+            if row > free_row:
+                free_rectangles.append((free_row, free_col, row - free_row, free_width))
+            if row + height < free_row + free_height:
+                free_rectangles.append((row + height, free_col, free_row + free_height - row - height, free_width))
+            if col > free_col:
+                free_rectangles.append((free_row, free_col, free_height, col - free_col))
+            if col + width < free_col + free_width:
+                free_rectangles.append((free_row, col + width, free_height, free_col + free_width - col - width))
+
+        # Drop the free rectangles contained in another one
+        self.free_rectangles = [rectangle for i, rectangle in enumerate(free_rectangles)
+                                if not any(contains(other, rectangle) and (other != rectangle or j < i)
+                                           for j, other in enumerate(free_rectangles) if j != i)]
+
+class Guillotine_Packer(Packer):
+    # Guillotine cuts with best area fit, splitting along the shorter leftover axis. The free rectangles
+    # cover the rows in use, and a kernel fitting in none of them opens new rows below them.
+    def __init__(self, width):
+        super().__init__(width)
+        self.free_rectangles = []
+
+    def find_position(self, kernel_shape):
+        kernel_height, kernel_width = kernel_shape
+        best_score = None
+        best_index = None
+        for index, (row, col, height, width) in enumerate(self.free_rectangles):
+            if height >= kernel_height and width >= kernel_width:
+                score = (height * width - kernel_height * kernel_width, row, col)
+                if best_score is None or score < best_score:
+                    best_score = score
+                    best_index = index
+        if best_index is None:
+            row, col, height, width = self.grid.height, 0, kernel_height, self.width
+        else:
+            row, col, height, width = self.free_rectangles.pop(best_index)
+
+        leftover_height, leftover_width = height - kernel_height, width - kernel_width
+        if leftover_width < leftover_height:
+            right = (row, col + kernel_width, kernel_height, leftover_width)
+            below = (row + kernel_height, col, leftover_height, width)
+        else:
+            right = (row, col + kernel_width, height, leftover_width)
+            below = (row + kernel_height, col, leftover_height, kernel_width)
+        self.free_rectangles.extend(rectangle for rectangle in (right, below) if rectangle[2] > 0 and rectangle[3] > 0)
+        return row, col
+
+def short_side_fit(height, width, kernel_shape):
+    leftover_height, leftover_width = height - kernel_shape[0], width - kernel_shape[1]
+    return (min(leftover_height, leftover_width), max(leftover_height, leftover_width))
+
+def contains(outer, inner):
+    return (outer[0] <= inner[0] and outer[1] <= inner[1] and
+            inner[0] + inner[2] <= outer[0] + outer[2] and inner[1] + inner[3] <= outer[1] + outer[3])
+
+packers = {"first_fit": First_Fit_Packer, "skyline": Skyline_Packer, "maxrects": MaxRects_Packer, "guillotine": Guillotine_Packer}
+
+def make_packer(name, width):
+    """
+    Creates a packer by name.
+
+    Args:
+        name (str): One of "first_fit", "skyline", "maxrects" or "guillotine".
+        width (int): The width of the array.
+
+    Returns:
+        Packer: An empty packer for an array of the given width.
+    """
+    return packers[name](width)
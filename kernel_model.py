@@ -0,0 +1,94 @@
+# Registry of the kernel models described in ACC_model.csv
+import os
+import csv
+
+class Kernel_Model():
+    # One shape variant of a kernel, named <Config>_<n> like the keys of personality_dict
+    __slots__ = ("name", "config", "kernel_id", "shape", "instruction_bytes", "PE_area")
+
+    def __init__(self, name, config, kernel_id, shape, instruction_bytes):
+        self.name = name
+        self.config = config
+        self.kernel_id = kernel_id
+        self.shape = shape
+        self.instruction_bytes = instruction_bytes
+        self.PE_area = shape[0] * shape[1]
+
+    def __str__(self):
+        return f"{self.name}: shape {self.shape}, {self.instruction_bytes} instruction bytes, kernel id {self.kernel_id}"
+
+class Kernel_Registry():
+    def __init__(self, models=None):
+        self.models = {model.name: model for model in models or []}
+        # Same format as the personality_dict built by preprocess: name -> [shape, instruction bytes]
+        self.personality_dict = {name: [model.shape, model.instruction_bytes] for name, model in self.models.items()}
+        self.PE_area = {name: model.PE_area for name, model in self.models.items()}
+        # Name -> names of the kernels whose PE area is within a factor of 2 of its own, as homogeneous clustering requires
+        self.shape_compatible = {name: {other for other, area in self.PE_area.items() if 0.5 <= seed_area / area <= 2.0}
+                                 for name, seed_area in self.PE_area.items()}
+
+    def __getitem__(self, name):
+        return self.models[name]
+
+    def __contains__(self, name):
+        return name in self.models
+
+    def __iter__(self):
+        return iter(self.models)
+
+    def __len__(self):
+        return len(self.models)
+
+# Parsed registries, keyed by the path and the modification time of the model file
+registry_cache = {}
+
+def parse_shape(shape):
+    return tuple(int(dimension) for dimension in shape.split(','))
+
+def parse_kernel_models(model_file_path):
+    """
+    Parses a kernel model CSV file in a single pass.
+
+    Every shape variant of a config becomes a Kernel_Model named <Config>_<n>, numbered in the order of the
+    rows and of the ';'-separated shapes. Configs whose first shape is 0,0 are not kernels and are skipped.
+
+    Args:
+        model_file_path (str): The path of the kernel model CSV file.
+
+    Returns:
+        Kernel_Registry: The kernel models, in the order of the configs in the file.
+    """
+    with open(model_file_path, 'r', newline='') as file:
+        rows = list(csv.DictReader(file))
+
+    rows_of_config = {}
+    for row in rows:
+        rows_of_config.setdefault(row['Config'], []).append(row)
+
+    models = []
+    for config, config_rows in rows_of_config.items():
+        if all(row['PE shape'].split(';')[0] == "0,0" for row in config_rows):
+            continue
+        key_id = 0
+        for row in config_rows:
+            for partitioned_shape in row['PE shape'].split(';'):
+                models.append(Kernel_Model(config + "_" + str(key_id), config, int(row['kernel id']),
+                                           parse_shape(partitioned_shape), int(row['Instructions']) * 8))
+                key_id += 1
+    return Kernel_Registry(models)
+
+def load_kernel_registry(model_file_path='ACC_model.csv'):
+    """
+    Returns the kernel registry of a model file, parsing the file only if it changed since the last call.
+
+    Args:
+        model_file_path (str, optional): The path of the kernel model CSV file. Defaults to 'ACC_model.csv'.
+
+    Returns:
+        Kernel_Registry: The kernel models of the file.
+    """
+    stat = os.stat(model_file_path)
+    cache_key = (os.path.abspath(model_file_path), stat.st_mtime_ns, stat.st_size)
+    if cache_key not in registry_cache:
+        registry_cache[cache_key] = parse_kernel_models(model_file_path)
+    return registry_cache[cache_key]
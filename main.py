@@ -3,13 +3,22 @@ sys.path.append(".")
 
 import ast
 import argparse
-import common
 import time
-import copy
 import os
-from utils import calculate_IMEM_sizes, preprocess
+import threading
+import tracemalloc
+from utils import load_trace, partition_trace, kernel_key_list
+from run_context import Sweep_Config, Run_Context
 from scripts.clustering_sweep import IMEM_sweep
 from scripts.placement_sweep import array_sweep
+from worker_pool import run_tasks, wait_for_writes
+from results_cache import evict_results
+from checkpoints import inputs_digest, write_manifest, load_completed_points, is_completed
+
+# Runs in progress in this process. tracemalloc is process-wide, so a run profiling memory must be the only one
+active_runs = 0
+memory_profiled_run = False
+runs_lock = threading.Lock()
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Clustering and placement input configuration.")
@@ -23,134 +32,275 @@ def parse_args():
     parser.add_argument('--heterogeneity_type', type=int, default=1, help='heterogeneous clustering:0, homogeneous clustering:1')
     parser.add_argument('--ED_kurtosis_mode', type=int, default=1, help='ED-kurtosis clustering mode')
     parser.add_argument('--parallelization', type=int, default=0, help='0: parallelization disabled, 1:parallelization enabled')
-    parser.add_argument('--number_of_workers', type=int, default=1, help='number of threads if parallelization is enabled')
+    parser.add_argument('--number_of_workers', type=int, default=1, help='number of worker processes if parallelization is enabled, capped by the number of available CPUs')
+    parser.add_argument('--concurrent_array_counts', type=int, default=0, help='0: parallelize the IMEM sizes of each array count, 1: run the array counts concurrently, one per worker')
     parser.add_argument('--output_dir', type=str, default="output", help='Directory to store output files')
+    parser.add_argument('--resume', type=str, default=None, help='numbered output directory of an interrupted run, whose missing points are computed and merged into it')
+    parser.add_argument('--save_clusters', type=int, default=1, help='0: keep clusterings in memory only, 1: also save them as JSON files')
+    parser.add_argument('--plots', type=str, default="pdf", choices=["none", "png", "pdf", "deferred"], help='placement plots: none, png, pdf or deferred (rectangles only, rendered later by scripts/render_plots.py)')
+    parser.add_argument('--timing_cache', type=int, default=1, help='0: always parse the timing trace, 1: reuse the cached preprocessed trace')
+    parser.add_argument('--cache_dir', type=str, default=".cache", help='Directory to store cached data')
+    parser.add_argument('--streaming_ingest', type=int, default=0, help='0: load the timing trace at once, 1: parse it in chunks to bound memory on large traces')
+    parser.add_argument('--results_cache', type=int, default=0, help='0: compute every point, 1: reuse the redistribution and placement results cached by earlier runs')
+    parser.add_argument('--results_cache_size', type=int, default=1024, help='size bound of the results cache in MB, the least recently used results are evicted')
+    parser.add_argument('--packer', type=str, default="first_fit", choices=["first_fit", "skyline", "maxrects", "guillotine"], help='rectangle packer placing the clusters on the arrays')
+    parser.add_argument('--profile', type=str, default="", help='comma separated stages to run under cProfile, dumped as profile_<stage>.prof next to profile.json (preprocess, partition, main_binning, redistribution, redistribution_check, placement, clustering_sweep, placement_sweep)')
+    parser.add_argument('--profile_memory', type=int, default=0, help='0: no memory tracing, 1: record the peak traced memory of each stage with tracemalloc')
+    parser.add_argument('--validation', type=str, default="full", choices=["off", "sampled", "full"], help='overlap validation of bins: off, sampled or full')
 
     args = parser.parse_args()
     return args
 
-def run():
-
-    start_time = time.time()
-    config_names = []
-
-    for array_count in range(common.array_count[0], common.array_count[1] + 1):        
-        file_path = "input_data.json"
-        common.personality_dict = preprocess(file_path, array_count)
-        
-        temp_timing_data = copy.deepcopy(common.timing_data.data)            
+def config_from_args(args):
+    return Sweep_Config(array_count=ast.literal_eval(args.array_count),
+                        initial_array_size=ast.literal_eval(args.initial_array_size),
+                        number_of_IMEM_sizes=args.number_of_IMEM_sizes,
+                        number_of_trees=args.number_of_trees,
+                        subband_count=args.number_of_subbands,
+                        homogeneous=args.heterogeneity_type,
+                        ED_kurtosis_mode=args.ED_kurtosis_mode,
+                        parallelization=args.parallelization,
+                        number_of_workers=args.number_of_workers,
+                        concurrent_array_counts=args.concurrent_array_counts,
+                        output_dir=args.output_dir,
+                        resume=args.resume,
+                        save_clusters=args.save_clusters,
+                        plots=args.plots,
+                        timing_cache=args.timing_cache,
+                        cache_path=args.cache_dir,
+                        streaming_ingest=args.streaming_ingest,
+                        results_cache=args.results_cache,
+                        results_cache_size=args.results_cache_size,
+                        packer=args.packer,
+                        profile_stages=[stage for stage in args.profile.split(',') if stage],
+                        profile_memory=args.profile_memory,
+                        validation=args.validation)
+
+def write_env_conf(context, file_name="env_conf.txt"):
+    config = context.config
+    f = open(os.path.join(context.base_path, file_name), "w")
+
+    print("Array count:", config.array_count)
+    f.write("Array count: " + str(config.array_count) + "\n")
+
+    print("Timing information collection performed with an array of size:", config.initial_array_size)
+    f.write("Timing information collection performed with an array of size: " + str(config.initial_array_size) + "\n")
+
+    print("Number of unique trees:", config.number_of_trees)
+    f.write("Number of unique trees: " + str(config.number_of_trees) + "\n")
+    
+    print("Number of active subbands:", config.subband_count)
+    f.write("Number of active subbands: " + str(config.subband_count) + "\n")
 
-        for array_id in range(array_count):
-            common.timing_data.data = temp_timing_data[array_id]
-            common.ED_kurtosis_mode = args.ED_kurtosis_mode
-            IMEM_sweep(array_id, array_count)
+    print("Sweeping", config.number_of_IMEM_sizes, "IMEM lines")
+    f.write("Sweeping " + str(config.number_of_IMEM_sizes) + " IMEM lines" + "\n")
 
-        common.ED_kurtosis_mode = args.ED_kurtosis_mode
+    print("Homogeneity type:", "Homogeneous" if config.homogeneous else "Heterogeneous")
+    f.write("Homogeneity type: ")
+    f.write("Homogeneous\n" if config.homogeneous else "Heterogeneous" + "\n")
 
-        # Define configuration name
-        config_name = f"{array_count}_arrays_{common.initial_array_size}_initial_size"
-        config_names.append(config_name)            
-        array_sweep(array_count=array_count)
+    print("ED+Kurtosis clustering mode:", "Enabled" if config.ED_kurtosis_mode else "Disabled")
+    f.write("ED+Kurtosis clustering mode: ")
+    f.write("Enabled\n" if config.ED_kurtosis_mode else "Disabled" + "\n")
 
-    end_time = time.time()
-    print("Elapsed time for clustering and placement:", end_time - start_time, "seconds")
+    print("Parallelization:", "Enabled" if config.parallelization else "Disabled")
+    f.write("Parallelization: ")
+    f.write("Enabled\n" if config.parallelization else "Disabled" + "\n")
 
-if __name__ == "__main__":
-    args = parse_args()
+    print("Number of workers:", config.number_of_workers)
+    f.write("Number of workers:" + str(config.number_of_workers)  + "\n")
 
-    common.array_count = ast.literal_eval(args.array_count)
-    common.homogeneous = args.heterogeneity_type
-    common.number_of_IMEM_sizes = args.number_of_IMEM_sizes
-    common.number_of_trees = args.number_of_trees
-    common.subband_count = args.number_of_subbands
-    common.initial_array_size = ast.literal_eval(args.initial_array_size)
-    common.ED_kurtosis_mode = args.ED_kurtosis_mode
-    common.output_dir = args.output_dir
-    common.base_path = args.output_dir + "/"
-
-    if common.parallelization:
-        common.number_of_workers = args.number_of_workers
-    else:
-        common.number_of_workers = 1
+    print("Concurrent array counts:", "Enabled" if config.concurrent_array_counts else "Disabled")
+    f.write("Concurrent array counts: ")
+    f.write("Enabled\n" if config.concurrent_array_counts else "Disabled" + "\n")
 
-    common.IMEM_size_list, common.IMEM_size_list_lines, common.IMEM_size_list_KB = calculate_IMEM_sizes()
+    print("Output directory:", config.output_dir)
+    f.write("Output directory:" + str(config.output_dir)  + "\n")
 
-    if not os.path.exists(common.base_path):
-        os.makedirs(common.base_path)
+    print("Resumed run:", "Enabled" if config.resume else "Disabled")
+    f.write("Resumed run: ")
+    f.write("Enabled\n" if config.resume else "Disabled" + "\n")
 
-    common.base_path += f"{common.array_count}_arrays_{common.initial_array_size}_initial_size/"
+    print("Saving clusterings:", "Enabled" if config.save_clusters else "Disabled")
+    f.write("Saving clusterings: ")
+    f.write("Enabled\n" if config.save_clusters else "Disabled" + "\n")
 
-    found = False
-    biggest_id = 0
-    for folder_name in os.listdir(common.output_dir):
-        if os.path.isdir(f"{common.output_dir}{folder_name}") and common.base_path[7:] in folder_name:
-            found = True
-            if int(folder_name.split("_")[-1]) > biggest_id:
-                biggest_id = int(folder_name.split("_")[-1])
+    print("Placement plots:", config.plots)
+    f.write("Placement plots: " + str(config.plots) + "\n")
 
-    if not found:
-        common.base_path += str(0)  
-    else:
-        common.base_path += str(biggest_id + 1)
+    print("Timing cache:", "Enabled" if config.timing_cache else "Disabled")
+    f.write("Timing cache: ")
+    f.write("Enabled\n" if config.timing_cache else "Disabled" + "\n")
 
-    if not os.path.exists(common.base_path):
-        os.makedirs(common.base_path)
+    print("Streaming ingest:", "Enabled" if config.streaming_ingest else "Disabled")
+    f.write("Streaming ingest: ")
+    f.write("Enabled\n" if config.streaming_ingest else "Disabled" + "\n")
 
-    f = open(common.base_path + "/env_conf.txt", "w")
+    print("Results cache:", f"Enabled ({config.results_cache_size} MB)" if config.results_cache else "Disabled")
+    f.write("Results cache: ")
+    f.write(f"Enabled ({config.results_cache_size} MB)\n" if config.results_cache else "Disabled" + "\n")
 
-    print("Array count:", common.array_count)
-    f.write("Array count: " + str(common.array_count) + "\n")
+    print("Packer:", config.packer)
+    f.write("Packer: " + str(config.packer) + "\n")
 
-    print("Timing information collection performed with an array of size:", common.initial_array_size)
-    f.write("Timing information collection performed with an array of size: " + str(common.initial_array_size) + "\n")
+    print("Profiled stages:", ", ".join(config.profile_stages) if config.profile_stages else "None")
+    f.write("Profiled stages: " + (", ".join(config.profile_stages) if config.profile_stages else "None") + "\n")
 
-    print("Number of unique trees:", common.number_of_trees)
-    f.write("Number of unique trees: " + str(common.number_of_trees) + "\n")
-    
-    print("Number of active subbands:", common.subband_count)
-    f.write("Number of active subbands: " + str(common.subband_count) + "\n")
+    print("Memory profiling:", "Enabled" if config.profile_memory else "Disabled")
+    f.write("Memory profiling: ")
+    f.write("Enabled\n" if config.profile_memory else "Disabled" + "\n")
 
-    print("Sweeping", common.number_of_IMEM_sizes, "IMEM lines")
-    f.write("Sweeping " + str(common.number_of_IMEM_sizes) + " IMEM lines" + "\n")
-
-    print("Homogeneity type:", "Homogeneous" if common.homogeneous else "Heterogeneous")
-    f.write("Homogeneity type: ")
-    f.write("Homogeneous\n" if common.homogeneous else "Heterogeneous" + "\n")
+    print("Validation:", config.validation)
+    f.write("Validation: " + str(config.validation) + "\n")
+    f.close()
 
-    print("ED+Kurtosis clustering mode:", "Enabled" if common.ED_kurtosis_mode else "Disabled")
-    f.write("ED+Kurtosis clustering mode: ")
-    f.write("Enabled\n" if common.ED_kurtosis_mode else "Disabled" + "\n")
+def prepare_output(context):
+    """
+    Creates the numbered output directory of a run, or reopens the one of the run being resumed,
+    and writes its manifest and env_conf.txt. A resumed run keeps the env_conf.txt of the original run
+    and writes its own configuration to the next free env_conf_resume_<n>.txt.
+
+    Args:
+        context (Run_Context): The context of the run, whose output paths are set.
+    """
+    config = context.config
+    if config.resume:
+        context.set_base_path(config.resume.rstrip("/"))
+    else:
+        config_path = os.path.join(config.output_dir, f"{config.array_count}_arrays_{config.initial_array_size}_initial_size")
+        os.makedirs(config_path, exist_ok=True)
+        # Each run claims the next free number in the folder of its configuration, also against concurrent runs
+        run_ids = [int(folder_name) for folder_name in os.listdir(config_path) if folder_name.isdigit()]
+        run_id = max(run_ids) + 1 if run_ids else 0
+        while True:
+            try:
+                os.makedirs(os.path.join(config_path, str(run_id)))
+                break
+            except FileExistsError:
+                run_id += 1
+        context.set_base_path(os.path.join(config_path, str(run_id)))
+
+    digest = inputs_digest(config, kernel_key_list)
+    if config.resume:
+        context.completed_points = load_completed_points(context.base_path, digest)
+        print("Resuming", context.base_path, "with", len(context.completed_points), "completed IMEM sizes")
+        resume_id = 0
+        while os.path.exists(os.path.join(context.base_path, f"env_conf_resume_{resume_id}.txt")):
+            resume_id += 1
+        write_env_conf(context, f"env_conf_resume_{resume_id}.txt")
+    else:
+        write_manifest(context.base_path, digest, config)
+        write_env_conf(context)
+
+    for path in (context.redistributed_clusters_path, context.unlimited_clusters_path, context.placement_base_path, context.data_base_path):
+        os.makedirs(path, exist_ok=True)
+
+def sweep_array_count(context, serial_config, array_count):
+    """
+    Clusters and places every array of an array count over the IMEM sizes of the sweep.
+
+    Args:
+        context (Run_Context): The context of the run, with the parsed trace.
+        serial_config (Sweep_Config): The configuration with a single worker, when the array counts run concurrently. None otherwise.
+        array_count (int): The number of arrays.
+
+    Returns:
+        tuple: The rows of data.csv and of packing.csv of the array count, header first.
+    """
+    if serial_config is not None:
+        # The IMEM sizes of an array count run by a worker are not parallelized again
+        context.config = serial_config
+
+    # Redistributed bins of each array, handed from the clustering to the placement in memory
+    array_bins = {}
+    if all(is_completed(context, array_count, IMEM_size) for IMEM_size in context.IMEM_size_list):
+        # Completed by the run being resumed, only data.csv is rewritten
+        return array_sweep(context, array_count=array_count, array_bins=array_bins)
+
+    with context.profile.stage("partition"):
+        partition_trace(context, array_count)
+
+    for array_id in range(array_count):
+        context.timing_data = context.array_timing_data[array_id].copy()
+        with context.profile.stage("clustering_sweep"):
+            array_bins[array_id] = IMEM_sweep(context, array_id, array_count)
+
+    with context.profile.stage("placement_sweep"):
+        return array_sweep(context, array_count=array_count, array_bins=array_bins)
+
+def run(config):
+    """
+    Runs the clustering and placement sweep of a configuration into a new numbered output directory.
+    All the state of the run is kept in its own Run_Context, so configurations can be run concurrently
+    in threads of the same process. Those runs should keep a single worker each, since a process pool
+    is forked from the calling process. A run with profile_memory needs the process to itself, as tracemalloc
+    and its peak are process-wide: it is refused while another run is in progress, and other runs are refused
+    while it is in progress.
+
+    The trace is parsed once and partitioned again for every array count. With concurrent_array_counts,
+    the array counts are the tasks of the workers instead of the IMEM sizes of each array count.
+
+    Args:
+        config (Sweep_Config): The configuration of the sweep.
+
+    Returns:
+        dict: The output directory of the run under "base_path", and the rows of data.csv and of packing.csv
+              of each array count under "data" and "packing", header first.
+
+    Raises:
+        RuntimeError: If this run profiles memory and another run is in progress, or the other way around.
+    """
+    global active_runs, memory_profiled_run
+    with runs_lock:
+        if memory_profiled_run or (config.profile_memory and active_runs):
+            raise RuntimeError("profile_memory traces the memory of the whole process, so it cannot be used while another run is in progress")
+        active_runs += 1
+        memory_profiled_run = bool(config.profile_memory)
+    tracing = config.profile_memory and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+    try:
+        return run_sweep(config)
+    finally:
+        if tracing:
+            tracemalloc.stop()
+        with runs_lock:
+            active_runs -= 1
+            memory_profiled_run = False
+
+def run_sweep(config):
+    # Body of run, once the run is allowed to start
+    context = Run_Context(config)
+    prepare_output(context)
 
-    print("Parallelization:", "Enabled" if common.parallelization else "Disabled")
-    f.write("Parallelization: ")
-    f.write("Enabled\n" if common.parallelization else "Disabled" + "\n")
+    start_time = time.time()
+    results = {"base_path": context.base_path, "data": {}, "packing": {}}
 
-    print("Number of workers:", common.number_of_workers)
-    f.write("Number of workers:" + str(common.number_of_workers)  + "\n")
+    array_counts = list(range(config.array_count[0], config.array_count[1] + 1))
+    if not all(is_completed(context, array_count, IMEM_size) for array_count in array_counts for IMEM_size in context.IMEM_size_list):
+        with context.profile.stage("preprocess"):
+            context.personality_dict = load_trace(context, config.timing_file_path, config.model_file_path)
 
-    print("Output directory:", common.output_dir)
-    f.write("Output directory:" + str(common.output_dir)  + "\n")
-    f.close()
+    if config.concurrent_array_counts and config.number_of_workers > 1 and len(array_counts) > 1:
+        array_count_rows = run_tasks(context, sweep_array_count, array_counts, config.serial())
+    else:
+        array_count_rows = [sweep_array_count(context, None, array_count) for array_count in array_counts]
+    for array_count, (data_rows, packing_rows) in zip(array_counts, array_count_rows):
+        results["data"][array_count], results["packing"][array_count] = data_rows, packing_rows
 
-    common.clustering_base_path = common.base_path + '/clustering/'
-    common.redistributed_clusters_path = common.clustering_base_path + '/redistributed_clusters/'
-    common.unlimited_clusters_path = common.clustering_base_path + '/unlimited_clusters/'
-    common.placement_base_path = common.base_path + '/placement/'
-    common.data_base_path = common.base_path + '/data/'
+    # Wait for the outputs that are still being written
+    wait_for_writes()
 
-    if not os.path.exists(common.clustering_base_path):
-        os.makedirs(common.clustering_base_path)
-    if not os.path.exists(common.clustering_base_path + 'redistributed_clusters/'):
-        os.makedirs(common.clustering_base_path + 'redistributed_clusters/')
-    if not os.path.exists(common.clustering_base_path + 'unlimited_clusters/'):
-        os.makedirs(common.clustering_base_path + 'unlimited_clusters/')
+    if config.results_cache:
+        evict_results(config.cache_path, config.results_cache_size * 1024 * 1024)
 
-    # Placement Output Paths
-    if not os.path.exists(common.placement_base_path):
-        os.makedirs(common.placement_base_path)
+    end_time = time.time()
+    print("Elapsed time for clustering and placement:", end_time - start_time, "seconds")
 
-    # Data Output Paths
-    if not os.path.exists(common.data_base_path):
-        os.makedirs(common.data_base_path)
+    # Where the time went, next to env_conf.txt
+    context.profile.write(context.base_path)
+    return results
 
-    run()
\ No newline at end of file
+if __name__ == "__main__":
+    args = parse_args()
+    run(config_from_args(args))
@@ -0,0 +1,241 @@
+# Long-running planning server answering clustering and placement queries of single points from warm state
+import os
+import sys
+import ast
+import json
+import time
+import argparse
+import threading
+import collections
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+sys.path.append(".")
+
+from run_context import Sweep_Config, Run_Context
+from utils import preprocess, array_area_calculation
+from greedy_clustering.clustering import main_binning, build_cluster_layouts, redistribute_layouts
+from greedy_clustering.placement import place
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Planning server answering clustering and placement queries of single points.")
+
+    parser.add_argument('--host', type=str, default="127.0.0.1", help='address of the HTTP server')
+    parser.add_argument('--port', type=int, default=8765, help='port of the HTTP server')
+    parser.add_argument('--socket', type=str, default=None, help='path of a Unix socket to serve on instead of HTTP over TCP')
+    parser.add_argument('--warm', type=str, default=None, help='array counts to preprocess and cluster at start up, e.g. "(4,4)"')
+    parser.add_argument('--initial_array_size', type=str, default="(32,32)", help='array size with which timing info is collected')
+    parser.add_argument('--heterogeneity_type', type=int, default=1, help='heterogeneous clustering:0, homogeneous clustering:1')
+    parser.add_argument('--ED_kurtosis_mode', type=int, default=1, help='ED-kurtosis clustering mode')
+    parser.add_argument('--packer', type=str, default="first_fit", choices=["first_fit", "skyline", "maxrects", "guillotine"], help='rectangle packer placing the clusters on the arrays')
+    parser.add_argument('--validation', type=str, default="full", choices=["off", "sampled", "full"], help='overlap validation of bins: off, sampled or full')
+    parser.add_argument('--timing_cache', type=int, default=1, help='0: always parse the timing trace, 1: reuse the cached preprocessed trace')
+    parser.add_argument('--cache_dir', type=str, default=".cache", help='Directory to store cached data')
+    parser.add_argument('--streaming_ingest', type=int, default=0, help='0: load the timing trace at once, 1: parse it in chunks to bound memory on large traces')
+    parser.add_argument('--max_cached_points', type=int, default=4096, help='number of answered points kept in memory, the least recently used are dropped')
+    parser.add_argument('--verbose', type=int, default=0, help='0: quiet, 1: log every request')
+
+    args = parser.parse_args()
+    return args
+
+class Planning_Server():
+    """
+    Warm state of the planning server: the kernel models, the preprocessed timing data of every array count
+    and the unlimited IMEM clustering of every array, from which a point is only redistributed and placed.
+    The clusters are validated once, when they are built. Redistributed bins only hold kernels of a single
+    cluster, so they are not validated again for every point. Answers are cached per point. The algorithms
+    share the run context, so points are computed one at a time.
+    """
+    def __init__(self, config, max_cached_points=4096):
+        self.context = Run_Context(config)
+        self.max_cached_points = max_cached_points
+        self.lock = threading.Lock()
+
+        # Array count -> timing data of each array
+        self.array_timing_data = {}
+        # (array count, array id) -> (cluster layouts, bin_id) of the unlimited IMEM clustering
+        self.clusterings = {}
+        # (array count, IMEM size) -> answer, least recently used first
+        self.points = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def clustering(self, array_count, array_id):
+        if array_count not in self.array_timing_data:
+            self.context.personality_dict = preprocess(self.context, self.context.config.timing_file_path, array_count, self.context.config.model_file_path)
+            self.array_timing_data[array_count] = self.context.array_timing_data
+        if (array_count, array_id) not in self.clusterings:
+            self.context.timing_data = self.array_timing_data[array_count][array_id].copy()
+            clusters, bin_id, bsum = main_binning(self.context)
+            self.clusterings[(array_count, array_id)] = (build_cluster_layouts(clusters, self.context.personality_dict), bin_id)
+        return self.clusterings[(array_count, array_id)]
+
+    def warm(self, array_counts):
+        with self.lock:
+            for array_count in array_counts:
+                for array_id in range(array_count):
+                    self.clustering(array_count, array_id)
+
+    def compute_point(self, array_count, IMEM_size):
+        arrays = []
+        array_sizes = []
+        for array_id in range(array_count):
+            cluster_layouts, bin_id = self.clustering(array_count, array_id)
+            bins = redistribute_layouts(self.context, cluster_layouts, bin_id, IMEM_size)
+            locations, array_size, packing_time = place(self.context, bins, "", array_id=array_id)
+            array_sizes.append(array_size)
+            arrays.append({"array_id": array_id, "bins": {str(key): [value[0], value[2]] for key, value in bins.items()},
+                           "locations": locations, "array_size": list(array_size), "packing_time": round(packing_time, 6)})
+
+        number_of_PEs, array_area, IMEM_area = array_area_calculation(IMEM_size, array_sizes, array_count)
+        return {"array_count": array_count, "IMEM_size": IMEM_size, "IMEM_lines": int(IMEM_size / 8), "packer": self.context.config.packer,
+                "number_of_PEs": number_of_PEs, "array_area": array_area, "IMEM_area": IMEM_area, "arrays": arrays}
+
+    def query(self, array_count, IMEM_size):
+        """
+        Answers the bins, placement and area of one point.
+
+        Args:
+            array_count (int): The number of arrays.
+            IMEM_size (int): The IMEM size, in the unit of the IMEM_Size column of data.csv.
+
+        Returns:
+            dict: The answer, with the bins, locations and size of every array under "arrays", and the
+                  time taken in milliseconds under "query_time_ms".
+        """
+        start_time = time.perf_counter()
+        key = (array_count, IMEM_size)
+        with self.lock:
+            answer = self.points.get(key)
+            cached = answer is not None
+            if cached:
+                self.points.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+                with self.context.profile.stage("point_query", IMEM_size):
+                    answer = self.compute_point(array_count, IMEM_size)
+                self.points[key] = answer
+                if len(self.points) > self.max_cached_points:
+                    self.points.popitem(last=False)
+        return dict(answer, cached=cached, query_time_ms=round((time.perf_counter() - start_time) * 1000, 3))
+
+    def status(self):
+        with self.lock:
+            return {"array_counts": sorted(self.array_timing_data), "clusterings": len(self.clusterings), "cached_points": len(self.points),
+                    "hits": self.hits, "misses": self.misses, "packer": self.context.config.packer,
+                    "initial_array_size": list(self.context.config.initial_array_size)}
+
+def parse_point(parameters):
+    # Array count and IMEM size of a query, the IMEM size being given either directly or in lines
+    array_count = int(parameters["array_count"])
+    if "IMEM_size" in parameters:
+        IMEM_size = int(parameters["IMEM_size"])
+    else:
+        IMEM_size = int(parameters["IMEM_lines"]) * 8
+    if array_count < 1 or IMEM_size < 1:
+        raise ValueError("array_count and the IMEM size must be positive")
+    return array_count, IMEM_size
+
+class Planning_Request_Handler(BaseHTTPRequestHandler):
+    """
+    GET  /point?array_count=4&IMEM_size=2560 (or IMEM_lines=320) answers one point,
+    POST /points with {"points": [{"array_count": 4, "IMEM_size": 2560}, ...]} answers several,
+    GET  /status describes the warm state.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/status":
+            self.send_json(200, self.server.planner.status())
+        elif url.path == "/point":
+            parameters = {name: values[0] for name, values in parse_qs(url.query).items()}
+            self.answer(lambda: self.server.planner.query(*parse_point(parameters)))
+        else:
+            self.send_json(404, {"error": f"Unknown path {url.path}"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/points":
+            self.send_json(404, {"error": f"Unknown path {url.path}"})
+            return
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.answer(lambda: {"points": [self.server.planner.query(*parse_point(point)) for point in json.loads(body)["points"]]})
+
+    def answer(self, compute):
+        try:
+            self.send_json(200, compute())
+        except (KeyError, ValueError, TypeError) as error:
+            self.send_json(400, {"error": f"Bad query: {error!r}"})
+        except SystemExit:
+            # The algorithms exit on infeasible points, e.g. a kernel that does not fit into the IMEM
+            self.send_json(422, {"error": "The point cannot be clustered or placed, see the server output"})
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # Clients of a Unix socket have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) and self.client_address else self.server.server_address
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+class Unix_HTTP_Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def make_server(planner, host="127.0.0.1", port=8765, socket_path=None, verbose=0):
+    """
+    Creates the server of a planner, over a Unix socket if a path is given and over HTTP on TCP otherwise.
+
+    Args:
+        planner (Planning_Server): The warm state answering the queries.
+        host (str, optional): The address of the HTTP server. Defaults to "127.0.0.1".
+        port (int, optional): The port of the HTTP server, 0 picks a free one. Defaults to 8765.
+        socket_path (str, optional): The path of the Unix socket. Defaults to None.
+        verbose (int, optional): Whether every request is logged. Defaults to 0.
+
+    Returns:
+        socketserver.BaseServer: The server, to be run with serve_forever.
+    """
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = Unix_HTTP_Server(socket_path, Planning_Request_Handler)
+    else:
+        server = ThreadingHTTPServer((host, port), Planning_Request_Handler)
+        server.daemon_threads = True
+    server.planner = planner
+    server.verbose = verbose
+    return server
+
+if __name__ == "__main__":
+    args = parse_args()
+    config = Sweep_Config(initial_array_size=ast.literal_eval(args.initial_array_size), homogeneous=args.heterogeneity_type,
+                          ED_kurtosis_mode=args.ED_kurtosis_mode, packer=args.packer, validation=args.validation, save_clusters=0,
+                          plots="none", timing_cache=args.timing_cache, cache_path=args.cache_dir, streaming_ingest=args.streaming_ingest)
+    planner = Planning_Server(config, args.max_cached_points)
+
+    if args.warm:
+        array_counts = ast.literal_eval(args.warm)
+        start_time = time.time()
+        planner.warm(range(array_counts[0], array_counts[1] + 1))
+        print("Warmed up array counts", array_counts, "in", time.time() - start_time, "seconds")
+
+    server = make_server(planner, args.host, args.port, args.socket, args.verbose)
+    print("Serving planning queries on", args.socket if args.socket else f"http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
@@ -0,0 +1,197 @@
+# Per-stage timings and counters of a run, written to profile.json next to env_conf.txt
+import os
+import json
+import time
+import pstats
+import cProfile
+import threading
+import contextlib
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+class Profile_Stats():
+    # Profile stats of a worker, in the form pstats.Stats accepts
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+def add_record(table, name, record):
+    if name not in table:
+        table[name] = {"calls": 0, "wall": 0.0, "cpu": 0.0}
+    entry = table[name]
+    entry["calls"] += record["calls"]
+    entry["wall"] += record["wall"]
+    entry["cpu"] += record["cpu"]
+    if "traced_peak" in record:
+        entry["traced_peak"] = max(entry.get("traced_peak", 0), record["traced_peak"])
+
+class Profile():
+    """
+    Timings and counters of one run. The output writer thread records into it concurrently with the run.
+    """
+    def __init__(self, profile_stages=None, profile_memory=False):
+        # Stages run under cProfile, and whether the run traces memory with the process-wide tracemalloc
+        self.profile_stages = list(profile_stages or [])
+        self.profile_memory = bool(profile_memory)
+        # Stage name -> {"calls", "wall", "cpu", "traced_peak"}, in total and per IMEM size
+        self.stages = {}
+        self.IMEM_stages = {}
+        # Counter name -> value, in total and per IMEM size
+        self.counters = {}
+        self.IMEM_counters = {}
+        # Distribution name -> {"count", "total", "min", "max"}
+        self.distributions = {}
+        # Stage name -> cProfile.Profile of this process, and the profile stats collected from the workers
+        self.profiles = {}
+        self.worker_profile_stats = {}
+
+        # Stages being timed, innermost last, each with the peak traced memory seen so far
+        self.stage_stack = []
+        self.active_profile = None
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name, IMEM_size=None):
+        """
+        Times a stage of the flow. The wall and CPU times are added to the totals of the stage and, if an IMEM
+        size is given, to those of the IMEM size. If the run profiles memory, the peak of traced memory is
+        recorded as well, and stages named in profile_stages are run under cProfile.
+
+        Args:
+            name (str): The name of the stage.
+            IMEM_size (int, optional): The IMEM size the stage works on.
+        """
+        profile = None
+        if name in self.profile_stages and self.active_profile is None:
+            profile = self.profiles.setdefault(name, cProfile.Profile())
+            self.active_profile = profile
+            profile.enable()
+
+        tracing = self.profile_memory and tracemalloc.is_tracing()
+        if tracing:
+            if self.stage_stack:
+                self.stage_stack[-1][1] = max(self.stage_stack[-1][1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        self.stage_stack.append([name, 0])
+
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            record = {"calls": 1, "wall": time.perf_counter() - wall, "cpu": time.process_time() - cpu}
+            _, traced_peak = self.stage_stack.pop()
+            if tracing:
+                record["traced_peak"] = max(traced_peak, tracemalloc.get_traced_memory()[1])
+                if self.stage_stack:
+                    self.stage_stack[-1][1] = max(self.stage_stack[-1][1], record["traced_peak"])
+                tracemalloc.reset_peak()
+            if profile is not None:
+                profile.disable()
+                self.active_profile = None
+
+            with self.lock:
+                add_record(self.stages, name, record)
+                if IMEM_size is not None:
+                    add_record(self.IMEM_stages.setdefault(IMEM_size, {}), name, record)
+
+    def count(self, name, value=1, IMEM_size=None):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+            if IMEM_size is not None:
+                self.IMEM_counters.setdefault(IMEM_size, {})
+                self.IMEM_counters[IMEM_size][name] = self.IMEM_counters[IMEM_size].get(name, 0) + value
+
+    def observe(self, name, value):
+        with self.lock:
+            if name not in self.distributions:
+                self.distributions[name] = {"count": 0, "total": 0, "min": value, "max": value}
+            distribution = self.distributions[name]
+            distribution["count"] += 1
+            distribution["total"] += value
+            distribution["min"] = min(distribution["min"], value)
+            distribution["max"] = max(distribution["max"], value)
+
+    def count_file(self, file_path):
+        self.count("bytes_written", os.path.getsize(file_path))
+
+    def snapshot(self):
+        """
+        Collects what this process recorded, to be merged into the profile of the parent process.
+
+        Returns:
+            dict: The stages, counters, distributions and profile stats recorded by this process.
+        """
+        profile_stats = {}
+        for name, profile in self.profiles.items():
+            profile.create_stats()
+            profile_stats[name] = profile.stats
+        return {"stages": self.stages, "IMEM_stages": self.IMEM_stages, "counters": self.counters, "IMEM_counters": self.IMEM_counters,
+                "distributions": self.distributions, "profile_stats": profile_stats}
+
+    def merge(self, worker_snapshot):
+        with self.lock:
+            for name, record in worker_snapshot["stages"].items():
+                add_record(self.stages, name, record)
+            for IMEM_size, records in worker_snapshot["IMEM_stages"].items():
+                for name, record in records.items():
+                    add_record(self.IMEM_stages.setdefault(IMEM_size, {}), name, record)
+            for name, value in worker_snapshot["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for IMEM_size, values in worker_snapshot["IMEM_counters"].items():
+                for name, value in values.items():
+                    self.IMEM_counters.setdefault(IMEM_size, {})
+                    self.IMEM_counters[IMEM_size][name] = self.IMEM_counters[IMEM_size].get(name, 0) + value
+            for name, distribution in worker_snapshot["distributions"].items():
+                if name not in self.distributions:
+                    self.distributions[name] = dict(distribution)
+                else:
+                    self.distributions[name]["count"] += distribution["count"]
+                    self.distributions[name]["total"] += distribution["total"]
+                    self.distributions[name]["min"] = min(self.distributions[name]["min"], distribution["min"])
+                    self.distributions[name]["max"] = max(self.distributions[name]["max"], distribution["max"])
+            for name, stats in worker_snapshot["profile_stats"].items():
+                self.worker_profile_stats.setdefault(name, []).append(stats)
+
+    def write(self, output_path):
+        """
+        Writes profile.json to the output directory, and a profile_<stage>.prof cProfile dump for every
+        stage named in profile_stages, which can be read with pstats or snakeviz.
+
+        Args:
+            output_path (str): The numbered output directory of the run.
+        """
+        peak_rss_bytes, peak_rss_children_bytes = peak_rss()
+        profile = {"stages": self.stages,
+                   "IMEM_sizes": {str(IMEM_size): {"stages": self.IMEM_stages.get(IMEM_size, {}), "counters": self.IMEM_counters.get(IMEM_size, {})}
+                                  for IMEM_size in sorted(set(self.IMEM_stages) | set(self.IMEM_counters))},
+                   "counters": self.counters,
+                   "distributions": {name: dict(distribution, mean=distribution["total"] / distribution["count"])
+                                     for name, distribution in self.distributions.items()},
+                   "peak_rss_bytes": peak_rss_bytes,
+                   "peak_rss_children_bytes": peak_rss_children_bytes,
+                   "tracemalloc": self.profile_memory and tracemalloc.is_tracing()}
+        with open(os.path.join(output_path, "profile.json"), 'w') as json_file:
+            json.dump(profile, json_file, indent=2)
+
+        for name in self.profile_stages:
+            sources = ([self.profiles[name]] if name in self.profiles else []) + [Profile_Stats(stats) for stats in self.worker_profile_stats.get(name, [])]
+            if not sources:
+                continue
+            profile_stats = pstats.Stats(sources[0])
+            for source in sources[1:]:
+                profile_stats.add(source)
+            profile_stats.dump_stats(os.path.join(output_path, f"profile_{name}.prof"))
+
+def peak_rss():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    if resource is None:
+        return None, None
+    scale = 1 if os.uname().sysname == "Darwin" else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale)
@@ -0,0 +1,108 @@
+# Persistent cache of redistribution and placement results, keyed by the content of their inputs
+import os
+import json
+import hashlib
+import tempfile
+
+# Bump when the clustering or the placement algorithms change their results
+cache_version = 1
+
+def results_cache_path(cache_path):
+    return os.path.join(cache_path, "results")
+
+def array_digest(timing_data):
+    # Digest of the processed timing data of an array
+    digest = hashlib.sha256()
+    digest.update(json.dumps(timing_data.kernel_names).encode())
+    for column in (timing_data.start, timing_data.end, timing_data.subband, timing_data.shape, timing_data.kernel):
+        digest.update(column.tobytes())
+    return digest.hexdigest()
+
+def clustering_keys(context, timing_data, IMEM_sizes):
+    """
+    Computes the cache keys of the clusterings of an array, from its processed timing data, the
+    clustering settings and the kernel model.
+
+    Args:
+        context (Run_Context): The context of the run.
+        timing_data (Timing_Data): The processed timing data of the array.
+        IMEM_sizes (list): The IMEM sizes of the sweep.
+
+    Returns:
+        tuple: A tuple containing:
+            - unlimited_key (str): The key of the unlimited IMEM clustering.
+            - IMEM_keys (dict): IMEM size -> key of the redistributed clustering.
+    """
+    base = json.dumps([cache_version, array_digest(timing_data), context.config.homogeneous, context.config.ED_kurtosis_mode,
+                       context.personality_dict], sort_keys=True)
+    unlimited_key = hashlib.sha256((base + "unlimited").encode()).hexdigest()
+    IMEM_keys = {IMEM_size: hashlib.sha256((base + str(IMEM_size)).encode()).hexdigest() for IMEM_size in IMEM_sizes}
+    return unlimited_key, IMEM_keys
+
+def placement_key(context, clustering_key):
+    # The placement of a clustering also depends on the packer and on the width of the array
+    return hashlib.sha256(json.dumps([cache_version, clustering_key, context.config.packer, list(context.config.initial_array_size)]).encode()).hexdigest()
+
+def load_result(context, key):
+    """
+    Loads a cached result and marks it as recently used.
+
+    Args:
+        context (Run_Context): The context of the run, whose profile counts the hits and misses.
+        key (str): The key of the result.
+
+    Returns:
+        The cached result, or None if it is not cached.
+    """
+    path = os.path.join(results_cache_path(context.config.cache_path), key + ".json")
+    try:
+        with open(path, 'r') as json_file:
+            result = json.load(json_file)
+        os.utime(path)
+    except (OSError, ValueError):
+        # Missing, evicted meanwhile or partially written by a crashed run
+        context.profile.count("results_cache_misses")
+        return None
+    context.profile.count("results_cache_hits")
+    return result
+
+def save_result(cache_path, key, result):
+    # Written to a temporary file first and moved in place at once, so concurrent runs never read a partial result
+    os.makedirs(results_cache_path(cache_path), exist_ok=True)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=results_cache_path(cache_path), suffix=".tmp")
+    try:
+        with os.fdopen(file_descriptor, 'w') as json_file:
+            json.dump(result, json_file)
+        os.replace(temp_path, os.path.join(results_cache_path(cache_path), key + ".json"))
+    except BaseException:
+        # A failed write must not leave a temporary file, which eviction would never remove
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+def evict_results(cache_path, max_bytes):
+    """
+    Deletes the least recently used results until the cache holds at most max_bytes.
+
+    Args:
+        cache_path (str): The cache directory.
+        max_bytes (int): The size bound of the cache.
+    """
+    if not os.path.isdir(results_cache_path(cache_path)):
+        return
+    entries = []
+    for entry in os.scandir(results_cache_path(cache_path)):
+        if entry.name.endswith(".json"):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total_bytes = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total_bytes -= size
@@ -0,0 +1,132 @@
+# Configuration of a sweep and the state of one run of it, passed explicitly through the clustering and placement
+import os
+import copy
+
+from data_structures import Timing_Data
+from kernel_model import Kernel_Registry
+from profiler import Profile
+from utils import calculate_IMEM_sizes
+
+class Sweep_Config():
+    """
+    Settings of a clustering and placement sweep, with the defaults of the command line of main.py.
+    A configuration is never changed by a run, so it can be shared by concurrent runs.
+    """
+    def __init__(self, array_count=(4, 4), initial_array_size=(32, 32), number_of_IMEM_sizes=32, number_of_trees=15,
+                 subband_count=48, homogeneous=1, ED_kurtosis_mode=1, parallelization=0, number_of_workers=1,
+                 output_dir="output", resume=None, save_clusters=1, plots="pdf", timing_cache=1, cache_path=".cache",
+                 streaming_ingest=0, results_cache=0, results_cache_size=1024, packer="first_fit", profile_stages=None,
+                 profile_memory=0, validation="full", validation_sampling_period=8,
+                 timing_file_path="input_data.json", model_file_path="ACC_model.csv", concurrent_array_counts=0):
+        # Configurations
+        self.array_count = tuple(array_count)
+        self.parallelization = parallelization
+        self.number_of_workers = number_of_workers if parallelization else 1
+        # Run the array counts concurrently, one per worker, instead of the IMEM sizes of each array count
+        self.concurrent_array_counts = concurrent_array_counts
+
+        # Sweep Configurations
+        self.homogeneous = homogeneous
+        self.number_of_IMEM_sizes = number_of_IMEM_sizes
+
+        # Preprocess
+        self.subband_count = subband_count
+        self.number_of_trees = number_of_trees
+        self.initial_array_size = tuple(initial_array_size)
+        self.timing_file_path = timing_file_path
+        self.model_file_path = model_file_path
+        # Cache of the preprocessed timing data
+        self.timing_cache = timing_cache
+        self.cache_path = cache_path
+        # Parse the timing trace in chunks instead of loading it at once
+        self.streaming_ingest = streaming_ingest
+        # Persistent cache of redistribution and placement results, bounded in MB
+        self.results_cache = results_cache
+        self.results_cache_size = results_cache_size
+
+        # Placement packer: "first_fit", "skyline", "maxrects" or "guillotine"
+        self.packer = packer
+
+        # Profiling: stages run under cProfile, and whether tracemalloc records the peak memory of each stage
+        self.profile_stages = list(profile_stages or [])
+        self.profile_memory = profile_memory
+
+        # Clustering
+        self.ED_kurtosis_mode = ED_kurtosis_mode
+        # Overlap validation of bins: "off", "sampled" or "full"
+        self.validation = validation
+        self.validation_sampling_period = validation_sampling_period
+
+        # Output
+        self.output_dir = output_dir
+        # Numbered output directory of an interrupted run to be completed
+        self.resume = resume
+        # Save the unlimited and redistributed clusterings as JSON files, next to handing them to the placement in memory
+        self.save_clusters = save_clusters
+        # Placement plots: "none", "png", "pdf" or "deferred"
+        self.plots = plots
+
+    def replace(self, **settings):
+        # Copy of the configuration with some settings changed
+        config = copy.copy(self)
+        for name, value in settings.items():
+            setattr(config, name, value)
+        return config
+
+    def serial(self):
+        # Same configuration with a single worker, for the sweeps of an array count run by a worker
+        return self.replace(parallelization=0, number_of_workers=1)
+
+class Run_Context():
+    """
+    State of one run of a Sweep_Config: the preprocessed timing data, the kernel models, the clustering mode,
+    the output paths and the profile. Every run owns its context, so runs do not share any mutable state.
+    """
+    def __init__(self, config):
+        self.config = config
+        self.IMEM_size_list, self.IMEM_size_list_lines, self.IMEM_size_list_KB = calculate_IMEM_sizes(config.number_of_IMEM_sizes)
+
+        # Preprocess
+        self.kernel_registry = Kernel_Registry()
+        self.personality_dict = {}
+        self.array_timing_data = {}
+        # Trace parsed once per run, sorted by array id, with the first row of each array id in it
+        self.trace_timing_data = None
+        self.trace_array_ids = None
+        self.trace_array_offsets = None
+        self.trace_paths = None
+        # Remaining slices of the array being clustered
+        self.timing_data = Timing_Data()
+
+        # Non-overlap scores of the kernel pairs of the timing data, indexed by kernel code, and kernel name ->
+        # (remaining rows, their starts and ends sorted by end) the scores of the kernel were computed from
+        self.pair_scores = None
+        self.pair_score_intervals = {}
+
+        # Clustering mode, changed by the clustering once the ED and Kurtosis slices are exhausted
+        self.ED_kurtosis_mode = config.ED_kurtosis_mode
+        # Placement
+        self.current_IMEM_size = None
+
+        # Array id -> IMEM size -> cache key of the redistributed clustering, computed before the clustering of the array
+        self.results_keys = {}
+        # (array count, IMEM size) -> checkpoint of the points completed by the run being resumed
+        self.completed_points = {}
+
+        self.profile = Profile(config.profile_stages, config.profile_memory)
+        self.set_base_path(config.output_dir)
+
+    def set_base_path(self, base_path):
+        # Output directory of the run and the clustering, placement and data directories within it
+        self.base_path = base_path
+        self.clustering_base_path = os.path.join(base_path, 'clustering/')
+        self.redistributed_clusters_path = os.path.join(self.clustering_base_path, 'redistributed_clusters/')
+        self.unlimited_clusters_path = os.path.join(self.clustering_base_path, 'unlimited_clusters/')
+        self.placement_base_path = os.path.join(base_path, 'placement/')
+        self.data_base_path = os.path.join(base_path, 'data/')
+
+    def __getstate__(self):
+        # Workers record their own profile, which is merged into this one when their tasks return
+        state = dict(self.__dict__)
+        state["profile"] = None
+        return state
@@ -0,0 +1,178 @@
+# Stage-level benchmark of the clustering and placement flow over a ladder of synthetic trace sizes
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+sys.path.append('.')
+
+from run_context import Sweep_Config, Run_Context
+from utils import preprocess
+from greedy_clustering.clustering import main_binning, redistribution_sweep
+from greedy_clustering.placement import place
+from scripts.clustering_sweep import IMEM_sweep
+from scripts.placement_sweep import array_sweep
+from scripts.generate_trace import write_trace
+from worker_pool import wait_for_writes
+
+stages = ["preprocess", "main_binning", "redistribution", "place", "full_sweep"]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Stage-level benchmark over a ladder of synthetic trace sizes.")
+
+    parser.add_argument('--ladder', type=str, default="5000,10000,20000,40000", help='comma separated slice counts of the generated traces')
+    parser.add_argument('--template', type=str, default="input_data.json", help='trace from which the kernel mix, shapes and durations are taken')
+    parser.add_argument('--kernel_mix', type=str, default=None, help='comma separated trace_key=weight pairs overriding the weights of the template')
+    parser.add_argument('--subbands', type=int, default=48, help='number of subbands of the generated traces')
+    parser.add_argument('--arrays', type=int, default=4, help='number of arrays of the generated traces and of the placement')
+    parser.add_argument('--number_of_IMEM_sizes', type=int, default=32, help='number of IMEM sizes to sweep')
+    parser.add_argument('--packer', type=str, default="first_fit", choices=["first_fit", "skyline", "maxrects", "guillotine"], help='rectangle packer placing the clusters on the arrays')
+    parser.add_argument('--repeats', type=int, default=1, help='runs per ladder step, the fastest one is kept')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the trace generator')
+    parser.add_argument('--output', type=str, default="benchmark.json", help='path of the JSON results')
+    parser.add_argument('--baseline', type=str, default=None, help='JSON results of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='relative slowdown against the baseline that is flagged as a regression')
+    parser.add_argument('--noise_floor', type=float, default=0.01, help='slowdowns smaller than this many seconds are never flagged')
+
+    args = parser.parse_args()
+    return args
+
+def configure(output_dir, array_count, number_of_IMEM_sizes, packer="first_fit"):
+    # Same configuration as the defaults of main.py, without clustering files, plots or the timing cache
+    return Sweep_Config(array_count=(array_count, array_count), number_of_IMEM_sizes=number_of_IMEM_sizes, packer=packer,
+                        output_dir=output_dir, save_clusters=0, plots="none", timing_cache=0, streaming_ingest=0)
+
+def time_stages(config, timing_file_path, array_count):
+    """
+    Times each stage of the flow on a trace, then the whole flow as main.run performs it. The stages and the whole
+    flow each start from a fresh run context, so both time the parse of the trace rather than reuse it.
+
+    Args:
+        config (Sweep_Config): The configuration returned by configure.
+        timing_file_path (str): The path of the trace.
+        array_count (int): The number of arrays.
+
+    Returns:
+        tuple: A tuple containing:
+            - timings (dict): Stage name -> wall time in seconds.
+            - kept_slices (int): The number of slices left after the kernel mapping and the shape filter.
+    """
+    timings = dict.fromkeys(stages, 0.0)
+
+    context = Run_Context(config)
+    start_time = time.perf_counter()
+    context.personality_dict = preprocess(context, timing_file_path, array_count)
+    timings["preprocess"] = time.perf_counter() - start_time
+    kept_slices = sum(len(timing_data) for timing_data in context.array_timing_data.values())
+
+    array_bins = {}
+    for array_id in range(array_count):
+        context.timing_data = context.array_timing_data[array_id].copy()
+
+        start_time = time.perf_counter()
+        clusters, bin_id, bsum = main_binning(context)
+        timings["main_binning"] += time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        IMEM_bins = redistribution_sweep(context, clusters, bin_id, bsum, context.IMEM_size_list)
+        timings["redistribution"] += time.perf_counter() - start_time
+
+        array_bins[array_id] = {IMEM_size: {key: [value[0], [item.slice for item in value[1]], value[2]] for key, value in bins.items()}
+                                for IMEM_size, bins in IMEM_bins.items()}
+
+    for IMEM_size in context.IMEM_size_list:
+        context.current_IMEM_size = IMEM_size
+        for array_id in range(array_count):
+            start_time = time.perf_counter()
+            place(context, array_bins[array_id][IMEM_size], context.placement_base_path, array_id=array_id)
+            timings["place"] += time.perf_counter() - start_time
+
+    context = Run_Context(config)
+    start_time = time.perf_counter()
+    context.personality_dict = preprocess(context, timing_file_path, array_count)
+    array_bins = {}
+    for array_id in range(array_count):
+        context.timing_data = context.array_timing_data[array_id].copy()
+        array_bins[array_id] = IMEM_sweep(context, array_id, array_count)
+    array_sweep(context, array_count=array_count, array_bins=array_bins)
+    wait_for_writes()
+    timings["full_sweep"] = time.perf_counter() - start_time
+
+    return timings, kept_slices
+
+def run_benchmark(ladder, template="input_data.json", kernel_mix=None, subband_count=48, array_count=4, number_of_IMEM_sizes=32,
+                  packer="first_fit", repeats=1, seed=0):
+    """
+    Generates a trace for every step of the ladder and keeps the fastest timing of each stage over the repeats.
+
+    Returns:
+        dict: The machine, the configuration and a result per ladder step, in the format of the baselines.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        config = configure(work_dir, array_count, number_of_IMEM_sizes, packer)
+        for slice_count in ladder:
+            timing_file_path = os.path.join(work_dir, f"trace_{slice_count}.json")
+            write_trace(timing_file_path, slice_count, template, kernel_mix, subband_count, array_count, seed=seed)
+
+            best_timings = None
+            for _ in range(repeats):
+                timings, kept_slices = time_stages(config, timing_file_path, array_count)
+                best_timings = timings if best_timings is None else {stage: min(best_timings[stage], timings[stage]) for stage in stages}
+
+            results.append({"slices": slice_count, "kept_slices": kept_slices, "stages": {stage: round(best_timings[stage], 6) for stage in stages}})
+            print(f"{slice_count} slices ({kept_slices} kept): " + ", ".join(f"{stage} {best_timings[stage]:.3f} s" for stage in stages))
+
+    return {"machine": {"python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count()},
+            "config": {"template": template, "kernel_mix": kernel_mix, "subbands": subband_count, "arrays": array_count,
+                       "number_of_IMEM_sizes": number_of_IMEM_sizes, "packer": packer, "repeats": repeats, "seed": seed},
+            "results": results}
+
+def find_regressions(benchmark, baseline, threshold=0.2, noise_floor=0.01):
+    """
+    Compares the stage timings of a benchmark with those of a baseline, for the ladder steps both have.
+
+    Args:
+        benchmark (dict): The results of run_benchmark.
+        baseline (dict): Earlier results of run_benchmark.
+        threshold (float, optional): The relative slowdown that is flagged. Defaults to 0.2.
+        noise_floor (float, optional): Slowdowns smaller than this many seconds are not flagged. Defaults to 0.01.
+
+    Returns:
+        list: (slices, stage, baseline time, time) of every flagged stage.
+    """
+    if benchmark["config"] != baseline["config"]:
+        print("Warning: the baseline was recorded with a different configuration", baseline["config"])
+
+    baseline_results = {result["slices"]: result["stages"] for result in baseline["results"]}
+    regressions = []
+    for result in benchmark["results"]:
+        if result["slices"] not in baseline_results:
+            continue
+        for stage, stage_time in result["stages"].items():
+            baseline_time = baseline_results[result["slices"]].get(stage)
+            if baseline_time is not None and stage_time > baseline_time * (1 + threshold) and stage_time - baseline_time > noise_floor:
+                regressions.append((result["slices"], stage, baseline_time, stage_time))
+    return regressions
+
+if __name__ == "__main__":
+    args = parse_args()
+    ladder = [int(slice_count) for slice_count in args.ladder.split(',')]
+    benchmark = run_benchmark(ladder, args.template, args.kernel_mix, args.subbands, args.arrays, args.number_of_IMEM_sizes,
+                              args.packer, args.repeats, args.seed)
+
+    with open(args.output, 'w') as json_file:
+        json.dump(benchmark, json_file, indent=2)
+    print("Saved the results to", args.output)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as json_file:
+            baseline = json.load(json_file)
+        regressions = find_regressions(benchmark, baseline, args.threshold, args.noise_floor)
+        for slices, stage, baseline_time, stage_time in regressions:
+            print(f"REGRESSION: {stage} at {slices} slices took {stage_time:.3f} s against {baseline_time:.3f} s in the baseline")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against", args.baseline)
@@ -2,48 +2,91 @@
 import os
 import sys
 import json
-import copy
-import common as common
-import concurrent.futures
 sys.path.append('.')
 
-from greedy_clustering.clustering import main_binning, redistribution
+from greedy_clustering.clustering import main_binning, redistribution_sweep
+from worker_pool import run_tasks, write_async
+from results_cache import clustering_keys, load_result, save_result
+from checkpoints import is_completed
 
-def process_imem_size(clusters, IMEM_size, bin_id, bsum, array_id = None, array_count = None):
-    common.current_IMEM_size = IMEM_size
-    bins = redistribution(clusters, bin_id, bsum, IMEM_size)
-
-    save_copy = copy.deepcopy(bins)
-
-    # Remove the second item from each bin's value
-    for key, value in save_copy.items():
-        for idx, item in enumerate(value[1]):
-            value[1][idx] = item.slice
-        # value.pop(1)
+def save_unlimited_clusters(context, clusters_kernel_mapping, array_id=None, array_count=None):
+    output_file_path = context.unlimited_clusters_path + 'unlimited_clusters_' + str(array_count) + "_arrays_id_" + str(array_id) + '.json'
+    with open(output_file_path, 'w') as json_file:
+        json.dump(clusters_kernel_mapping, json_file, indent=2)
+    context.profile.count_file(output_file_path)
 
-    output_file_path = f"{common.redistributed_clusters_path}{int(IMEM_size / 8)}_lines_" + str(array_count) + "_arrays_id_" + str(array_id) + ".json"
+def save_redistributed_clusters(context, bins, IMEM_size, array_id=None, array_count=None):
+    output_file_path = f"{context.redistributed_clusters_path}{int(IMEM_size / 8)}_lines_" + str(array_count) + "_arrays_id_" + str(array_id) + ".json"
     # Dump each clustering of IMEM size to a JSON file
     with open(output_file_path, 'w') as json_file:
-        json.dump(save_copy, json_file, indent=2)
+        json.dump(bins, json_file, indent=2)
+    context.profile.count_file(output_file_path)
+
+def process_imem_sizes(context, data, IMEM_sizes):
+    clusters, bin_id, bsum, array_id, array_count, IMEM_keys = data
+
+    # Clip the clusters for the given IMEM sizes in a single pass
+    IMEM_bins = redistribution_sweep(context, clusters, bin_id, bsum, IMEM_sizes)
 
-def IMEM_sweep(array_id=None, array_count=None):
-    # Perform the clustering assuming IMEM size is unlimited
-    clusters, bin_id, bsum = main_binning()
+    for IMEM_size in IMEM_sizes:
+        # Replace the slices of each bin with their (start, end) intervals
+        IMEM_bins[IMEM_size] = {key: [value[0], [item.slice for item in value[1]], value[2]] for key, value in IMEM_bins[IMEM_size].items()}
+        if context.config.save_clusters:
+            write_async(save_redistributed_clusters, context, IMEM_bins[IMEM_size], IMEM_size, array_id, array_count)
+        if IMEM_keys:
+            write_async(save_result, context.config.cache_path, IMEM_keys[IMEM_size], IMEM_bins[IMEM_size])
 
-    save_copy = copy.deepcopy(clusters)            
+    return IMEM_bins
 
-    clusters_kernel_mapping = {}
-    for id in clusters:
-        clusters_kernel_mapping[id] = clusters[id].kernels
+def load_cached_clusterings(context, array_id, IMEM_sizes):
+    # Clusterings of earlier runs with the same inputs, the keys being kept for the placement
+    unlimited_key, IMEM_keys = clustering_keys(context, context.timing_data, IMEM_sizes)
+    context.results_keys[array_id] = IMEM_keys
+
+    cached_bins = {}
+    for IMEM_size, key in IMEM_keys.items():
+        bins = load_result(context, key)
+        if bins is not None:
+            # JSON turns the bin ids into strings
+            cached_bins[IMEM_size] = {int(bin_key): value for bin_key, value in bins.items()}
+    return unlimited_key, IMEM_keys, load_result(context, unlimited_key), cached_bins
+
+def IMEM_sweep(context, array_id=None, array_count=None):
+    # IMEM sizes already completed by the run being resumed are skipped
+    pending_IMEM_sizes = [IMEM_size for IMEM_size in context.IMEM_size_list if not is_completed(context, array_count, IMEM_size)]
+
+    unlimited_key, IMEM_keys, cached_mapping, IMEM_bins = None, None, None, {}
+    if context.config.results_cache:
+        unlimited_key, IMEM_keys, cached_mapping, IMEM_bins = load_cached_clusterings(context, array_id, pending_IMEM_sizes)
+    IMEM_sizes = [IMEM_size for IMEM_size in pending_IMEM_sizes if IMEM_size not in IMEM_bins]
+
+    if IMEM_sizes or cached_mapping is None:
+        # Perform the clustering assuming IMEM size is unlimited
+        with context.profile.stage("main_binning"):
+            clusters, bin_id, bsum = main_binning(context)
+
+        clusters_kernel_mapping = {}
+        for id in clusters:
+            clusters_kernel_mapping[id] = clusters[id].kernels
+        if context.config.results_cache:
+            write_async(save_result, context.config.cache_path, unlimited_key, clusters_kernel_mapping)
+    else:
+        # Every IMEM size is cached, so the clustering is skipped
+        clusters_kernel_mapping = cached_mapping
 
     # Save unlimited clustering to a json file
-    with open(common.unlimited_clusters_path + 'unlimited_clusters_' + str(array_count) + "_arrays_id_" + str(array_id) + '.json', 'w') as json_file:
-        json.dump(clusters_kernel_mapping, json_file, indent=2)
+    if context.config.save_clusters:
+        write_async(save_unlimited_clusters, context, clusters_kernel_mapping, array_id, array_count)
+        for IMEM_size, bins in IMEM_bins.items():
+            write_async(save_redistributed_clusters, context, bins, IMEM_size, array_id, array_count)
 
-    # Start the clipping for each IMEM size
-    with concurrent.futures.ProcessPoolExecutor(max_workers=common.number_of_workers) as executor:
-        futures = {executor.submit(process_imem_size, clusters, IMEM_size, bin_id, bsum, array_id, array_count): IMEM_size for IMEM_size in common.IMEM_size_list}
+    # Start the clipping of the IMEM sizes that are not cached, spread round-robin over the workers
+    if IMEM_sizes:
+        number_of_workers = max(1, context.config.number_of_workers or 1)
+        IMEM_size_chunks = [IMEM_sizes[worker::number_of_workers] for worker in range(number_of_workers)]
+        results = run_tasks(context, process_imem_sizes, [chunk for chunk in IMEM_size_chunks if chunk], (clusters, bin_id, bsum, array_id, array_count, IMEM_keys))
 
-        for future in concurrent.futures.as_completed(futures):
-            future.result()
-    
\ No newline at end of file
+        # Redistributed bins of every IMEM size, handed to the placement in memory
+        for result in results:
+            IMEM_bins.update(result)
+    return {IMEM_size: IMEM_bins[IMEM_size] for IMEM_size in pending_IMEM_sizes}
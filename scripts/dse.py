@@ -0,0 +1,174 @@
+# Design-space exploration of array count, IMEM size and heterogeneity type for the Pareto front of area, cluster count and PEs
+import os
+import sys
+import ast
+import csv
+import time
+import argparse
+sys.path.append('.')
+
+from run_context import Sweep_Config, Run_Context
+from utils import load_trace, partition_trace, array_area_calculation
+from greedy_clustering.clustering import main_binning, build_cluster_layouts, redistribute_layouts
+from greedy_clustering.placement import place
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Pareto-pruned design-space exploration over array count, IMEM size and heterogeneity type.")
+
+    parser.add_argument('--array_count', type=str, default="(4,4)", help='range of the number of arrays, every array id of the trace must exist with each of them')
+    parser.add_argument('--heterogeneity_types', type=str, default="0,1", help='comma separated heterogeneity types, heterogeneous clustering:0, homogeneous clustering:1')
+    parser.add_argument('--number_of_IMEM_sizes', type=int, default=32, help='number of IMEM sizes of the space')
+    parser.add_argument('--initial_array_size', type=str, default="(32,32)", help='array size with which timing info is collected')
+    parser.add_argument('--ED_kurtosis_mode', type=int, default=1, help='ED-kurtosis clustering mode')
+    parser.add_argument('--packer', type=str, default="first_fit", choices=["first_fit", "skyline", "maxrects", "guillotine"], help='rectangle packer placing the clusters on the arrays')
+    parser.add_argument('--validation', type=str, default="full", choices=["off", "sampled", "full"], help='overlap validation of bins: off, sampled or full')
+    parser.add_argument('--timing_cache', type=int, default=1, help='0: always parse the timing trace, 1: reuse the cached preprocessed trace')
+    parser.add_argument('--cache_dir', type=str, default=".cache", help='Directory to store cached data')
+    parser.add_argument('--exhaustive', type=int, default=0, help='0: skip the points whose lower bounds are dominated, 1: place every point')
+    parser.add_argument('--output', type=str, default="pareto.csv", help='path of the Pareto CSV')
+
+    args = parser.parse_args()
+    return args
+
+def dominates(objectives1, objectives2):
+    # Whether the first objectives are no worse in all and better in one, every objective being minimized
+    return all(value1 <= value2 for value1, value2 in zip(objectives1, objectives2)) and objectives1 != objectives2
+
+def bin_rectangle(personality_dict, kernels):
+    # Rectangle a bin takes on the array, the biggest height and width of its kernels as place packs it
+    return (max(personality_dict[kernel][0][0] for kernel in kernels), max(personality_dict[kernel][0][1] for kernel in kernels))
+
+def lower_bounds(context, array_bins, IMEM_size, array_count):
+    """
+    Bounds the area and the number of PEs of a point from below, before it is placed.
+
+    Every array has the width of the initial array size and only its occupied rows count, so it has at least as
+    many rows as its tallest bin and as the total area of its bins divided by its width. Bins wider than the array
+    occupy no rows. The area grows with the number of PEs for a given IMEM size.
+
+    Args:
+        context (Run_Context): The context of the heterogeneity type.
+        array_bins (list): The redistributed bins of each array.
+        IMEM_size (int): The IMEM size.
+        array_count (int): The number of arrays.
+
+    Returns:
+        tuple: The lower bounds of the total area and of the number of PEs.
+    """
+    width = context.config.initial_array_size[0]
+    array_sizes = []
+    for bins in array_bins:
+        occupied_area, tallest = 0, 0
+        for kernels, slices, size in bins.values():
+            height, bin_width = bin_rectangle(context.personality_dict, kernels)
+            if bin_width <= width:
+                occupied_area += height * bin_width
+                tallest = max(tallest, height)
+        array_sizes.append((width, max(tallest, -(-occupied_area // width))))
+    number_of_PEs, array_area, IMEM_area = array_area_calculation(IMEM_size, array_sizes, array_count)
+    return array_area + IMEM_area, number_of_PEs
+
+def cluster_layouts(context, array_count):
+    # Unlimited IMEM clustering of every array of an array count, which does not depend on the IMEM size
+    partition_trace(context, array_count)
+    layouts = []
+    for array_id in range(array_count):
+        context.timing_data = context.array_timing_data[array_id].copy()
+        clusters, bin_id, bsum = main_binning(context)
+        layouts.append((build_cluster_layouts(clusters, context.personality_dict), bin_id))
+    return layouts
+
+def evaluate(context, layouts, IMEM_size, array_count):
+    # Places every array of a point, returning its objectives and its row of the Pareto CSV
+    array_sizes = []
+    cluster_count = 0
+    for array_id, (cluster_layout, bin_id) in enumerate(layouts):
+        bins = redistribute_layouts(context, cluster_layout, bin_id, IMEM_size)
+        locations, array_size, packing_time = place(context, bins, "", array_id=array_id)
+        array_sizes.append(array_size)
+        cluster_count += len(bins)
+    number_of_PEs, array_area, IMEM_area = array_area_calculation(IMEM_size, array_sizes, array_count)
+    objectives = (array_area + IMEM_area, cluster_count, number_of_PEs)
+    row = (context.config.homogeneous, array_count, IMEM_size, int(IMEM_size / 8), array_area + IMEM_area, array_area, IMEM_area,
+           cluster_count, number_of_PEs, array_sizes)
+    return objectives, row
+
+def explore(config, heterogeneity_types=(0, 1), exhaustive=False):
+    """
+    Searches the array counts of the configuration, its IMEM sizes and the heterogeneity types for the Pareto front of
+    (Array_Area + IMEM_Area, cluster count, number of PEs), all minimized. The cluster count is summed over the arrays.
+
+    Clustering and redistribution are cheap next to placement, so every point is redistributed first, which gives its
+    exact cluster count and lower bounds of its area and number of PEs. Points are then placed from the smallest
+    bounds up, and a point is skipped when a placed point dominates its bounds, since it is then dominated as well.
+    The front is the same as the one of placing every point.
+
+    Args:
+        config (Sweep_Config): The configuration of the space, whose heterogeneity type is replaced by each of the given ones.
+        heterogeneity_types (tuple, optional): The heterogeneity types to search. Defaults to (0, 1).
+        exhaustive (bool, optional): Whether every point is placed. Defaults to False.
+
+    Returns:
+        tuple: A tuple containing:
+            - front (list): The rows of the Pareto front, by increasing total area.
+            - evaluated (int): The number of placed points.
+            - total (int): The number of points of the space.
+    """
+    contexts = {}
+    candidates = []
+    for heterogeneity_type in heterogeneity_types:
+        context = Run_Context(config.replace(homogeneous=heterogeneity_type, plots="none", save_clusters=0))
+        if contexts:
+            # The trace is parsed once for all heterogeneity types
+            source = next(iter(contexts.values()))
+            for attribute in ("kernel_registry", "personality_dict", "trace_timing_data", "trace_array_ids", "trace_array_offsets", "trace_paths"):
+                setattr(context, attribute, getattr(source, attribute))
+        else:
+            context.personality_dict = load_trace(context, config.timing_file_path, config.model_file_path)
+        contexts[heterogeneity_type] = context
+
+        for array_count in range(config.array_count[0], config.array_count[1] + 1):
+            layouts = cluster_layouts(context, array_count)
+            for IMEM_size in context.IMEM_size_list:
+                array_bins = [redistribute_layouts(context, cluster_layout, bin_id, IMEM_size) for cluster_layout, bin_id in layouts]
+                area_bound, PEs_bound = lower_bounds(context, array_bins, IMEM_size, array_count)
+                bounds = (area_bound, sum(len(bins) for bins in array_bins), PEs_bound)
+                candidates.append((bounds, heterogeneity_type, array_count, IMEM_size, layouts))
+
+    candidates.sort(key=lambda candidate: candidate[:4])
+    front = []
+    evaluated = 0
+    for bounds, heterogeneity_type, array_count, IMEM_size, layouts in candidates:
+        if not exhaustive and any(dominates(objectives, bounds) for objectives, row in front):
+            continue
+        objectives, row = evaluate(contexts[heterogeneity_type], layouts, IMEM_size, array_count)
+        evaluated += 1
+        if any(dominates(front_objectives, objectives) for front_objectives, front_row in front):
+            continue
+        front = [(front_objectives, front_row) for front_objectives, front_row in front if not dominates(objectives, front_objectives)]
+        front.append((objectives, row))
+
+    front.sort(key=lambda point: (point[0], point[1][:4]))
+    return [row for objectives, row in front], evaluated, len(candidates)
+
+def write_pareto_csv(output_path, front):
+    with open(output_path, mode="w", newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(("Heterogeneity_Type", "Number of Arrays", "IMEM_Size", "IMEM_Lines", "Total_Area", "Array_Area", "IMEM_Area",
+                         "Cluster_Count", "Number_of_PEs", "Array Sizes"))
+        writer.writerows(front)
+
+if __name__ == "__main__":
+    args = parse_args()
+    config = Sweep_Config(array_count=ast.literal_eval(args.array_count), initial_array_size=ast.literal_eval(args.initial_array_size),
+                          number_of_IMEM_sizes=args.number_of_IMEM_sizes, ED_kurtosis_mode=args.ED_kurtosis_mode, packer=args.packer,
+                          validation=args.validation, timing_cache=args.timing_cache, cache_path=args.cache_dir)
+    heterogeneity_types = [int(heterogeneity_type) for heterogeneity_type in args.heterogeneity_types.split(',')]
+
+    start_time = time.time()
+    front, evaluated, total = explore(config, heterogeneity_types, args.exhaustive)
+    output_directory = os.path.dirname(args.output)
+    if output_directory:
+        os.makedirs(output_directory, exist_ok=True)
+    write_pareto_csv(args.output, front)
+    print(f"Placed {evaluated} of {total} points in {time.time() - start_time:.2f} seconds, {len(front)} on the Pareto front, saved to {args.output}")
@@ -0,0 +1,112 @@
+# Generates synthetic timing traces in the schema of input_data.json
+import sys
+import json
+import argparse
+import numpy as np
+sys.path.append('.')
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Synthetic timing trace generation.")
+
+    parser.add_argument('output_path', type=str, help='path of the generated trace')
+    parser.add_argument('--slices', type=int, default=28000, help='number of timing slices to generate')
+    parser.add_argument('--template', type=str, default="input_data.json", help='trace from which the kernel mix, shapes and durations are taken')
+    parser.add_argument('--kernel_mix', type=str, default=None, help='comma separated trace_key=weight pairs overriding the weights of the template, e.g. "ED1_b1=4,Kurtosis1_b1=1"')
+    parser.add_argument('--subbands', type=int, default=48, help='number of subbands')
+    parser.add_argument('--arrays', type=int, default=4, help='number of arrays')
+    parser.add_argument('--time_per_slice', type=float, default=None, help='length of the trace per slice, defaults to the density of the template')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random generator')
+
+    args = parser.parse_args()
+    return args
+
+def kernel_mix_from_trace(timing_file_path):
+    """
+    Derives the kernel mix of a trace.
+
+    Args:
+        timing_file_path (str): The path of a trace in the schema of input_data.json.
+
+    Returns:
+        tuple: A tuple containing:
+            - kernel_mix (dict): Trace key -> {"weight": slice count, "shapes": [[shape, count], ...], "duration": [min, max]}.
+            - time_per_slice (float): The length of the trace divided by its number of slices.
+    """
+    with open(timing_file_path, 'r') as file:
+        raw_timing_data = json.load(file)
+
+    kernel_mix = {}
+    slice_count, trace_end = 0, 0
+    for trace_key, timing_items in raw_timing_data.items():
+        if not timing_items:
+            continue
+        shapes = {}
+        for timing_item in timing_items:
+            shape = (int(timing_item[3][0]), int(timing_item[3][1]))
+            shapes[shape] = shapes.get(shape, 0) + 1
+        durations = [int(timing_item[1]) - int(timing_item[0]) for timing_item in timing_items]
+        kernel_mix[trace_key] = {"weight": len(timing_items),
+                                 "shapes": [[list(shape), count] for shape, count in shapes.items()],
+                                 "duration": [min(durations), max(durations)]}
+        slice_count += len(timing_items)
+        trace_end = max(trace_end, max(int(timing_item[1]) for timing_item in timing_items))
+    return kernel_mix, trace_end / max(slice_count, 1)
+
+def parse_kernel_mix(kernel_mix_string, kernel_mix):
+    # Keeps the shapes and durations of the template for the given trace keys, with the given weights
+    weights = {}
+    for pair in kernel_mix_string.split(','):
+        trace_key, weight = pair.split('=')
+        if trace_key.strip() not in kernel_mix:
+            raise ValueError(f"Trace key {trace_key.strip()} is not in the template trace")
+        weights[trace_key.strip()] = float(weight)
+    return {trace_key: dict(kernel_mix[trace_key], weight=weight) for trace_key, weight in weights.items()}
+
+def generate_trace(slice_count, kernel_mix, subband_count=48, array_count=4, time_per_slice=30.0, seed=0):
+    """
+    Generates a synthetic trace with slices spread uniformly over time, subbands and arrays.
+
+    Args:
+        slice_count (int): The number of slices to generate.
+        kernel_mix (dict): Trace key -> {"weight", "shapes", "duration"}, as returned by kernel_mix_from_trace.
+        subband_count (int, optional): The number of subbands. Defaults to 48.
+        array_count (int, optional): The number of arrays. Defaults to 4.
+        time_per_slice (float, optional): The length of the trace per slice, which sets the density of the slices. Defaults to 30.0.
+        seed (int, optional): The seed of the random generator. Defaults to 0.
+
+    Returns:
+        dict: Trace key -> list of [start, end, subband, [height, width], array id] records.
+    """
+    random = np.random.default_rng(seed)
+    trace_keys = list(kernel_mix.keys())
+    weights = np.array([kernel_mix[trace_key]["weight"] for trace_key in trace_keys], dtype=float)
+    counts = random.multinomial(slice_count, weights / weights.sum())
+    horizon = max(1, int(slice_count * time_per_slice))
+
+    raw_timing_data = {}
+    for trace_key, count in zip(trace_keys, counts):
+        shapes = [shape for shape, _ in kernel_mix[trace_key]["shapes"]]
+        shape_weights = np.array([weight for _, weight in kernel_mix[trace_key]["shapes"]], dtype=float)
+        shape_ids = random.choice(len(shapes), size=count, p=shape_weights / shape_weights.sum())
+        starts = np.sort(random.integers(0, horizon, size=count))
+        durations = random.integers(kernel_mix[trace_key]["duration"][0], kernel_mix[trace_key]["duration"][1] + 1, size=count)
+        subbands = random.integers(1, subband_count + 1, size=count)
+        array_ids = random.integers(0, array_count, size=count)
+        raw_timing_data[trace_key] = [[int(start), int(start + duration), int(subband), list(shapes[shape_id]), int(array_id)]
+                                      for start, duration, subband, shape_id, array_id in zip(starts, durations, subbands, shape_ids, array_ids)]
+    return raw_timing_data
+
+def write_trace(output_path, slice_count, template="input_data.json", kernel_mix_string=None, subband_count=48, array_count=4, time_per_slice=None, seed=0):
+    kernel_mix, template_time_per_slice = kernel_mix_from_trace(template)
+    if kernel_mix_string:
+        kernel_mix = parse_kernel_mix(kernel_mix_string, kernel_mix)
+    raw_timing_data = generate_trace(slice_count, kernel_mix, subband_count, array_count,
+                                     template_time_per_slice if time_per_slice is None else time_per_slice, seed)
+    with open(output_path, 'w') as file:
+        json.dump(raw_timing_data, file)
+    return raw_timing_data
+
+if __name__ == "__main__":
+    args = parse_args()
+    raw_timing_data = write_trace(args.output_path, args.slices, args.template, args.kernel_mix, args.subbands, args.arrays, args.time_per_slice, args.seed)
+    print("Generated", sum(len(timing_items) for timing_items in raw_timing_data.values()), "slices in", args.output_path)
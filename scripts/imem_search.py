@@ -0,0 +1,146 @@
+# Adaptive search of the IMEM size of minimum area, instead of placing every IMEM size of a linear sweep
+import os
+import sys
+import ast
+import csv
+import time
+import bisect
+import argparse
+sys.path.append('.')
+
+from run_context import Sweep_Config, Run_Context
+from utils import load_trace
+from greedy_clustering.clustering import redistribute_layouts
+from scripts.dse import cluster_layouts, lower_bounds, evaluate
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Adaptive search of the IMEM size of minimum area.")
+
+    parser.add_argument('--array_count', type=str, default="(4,4)", help='range of the number of arrays')
+    parser.add_argument('--min_IMEM_lines', type=int, default=320, help='smallest IMEM size in lines')
+    parser.add_argument('--max_IMEM_lines', type=int, default=2304, help='largest IMEM size in lines')
+    parser.add_argument('--granularity', type=int, default=64, help='step between the IMEM sizes in lines')
+    parser.add_argument('--initial_array_size', type=str, default="(32,32)", help='array size with which timing info is collected')
+    parser.add_argument('--heterogeneity_type', type=int, default=1, help='heterogeneous clustering:0, homogeneous clustering:1')
+    parser.add_argument('--ED_kurtosis_mode', type=int, default=1, help='ED-kurtosis clustering mode')
+    parser.add_argument('--packer', type=str, default="first_fit", choices=["first_fit", "skyline", "maxrects", "guillotine"], help='rectangle packer placing the clusters on the arrays')
+    parser.add_argument('--validation', type=str, default="full", choices=["off", "sampled", "full"], help='overlap validation of bins: off, sampled or full')
+    parser.add_argument('--timing_cache', type=int, default=1, help='0: always parse the timing trace, 1: reuse the cached preprocessed trace')
+    parser.add_argument('--cache_dir', type=str, default=".cache", help='Directory to store cached data')
+    parser.add_argument('--exhaustive', type=int, default=0, help='0: adaptive search, 1: place every IMEM size of the range')
+    parser.add_argument('--output', type=str, default="imem_search.csv", help='path of the CSV of the placed IMEM sizes')
+
+    args = parser.parse_args()
+    return args
+
+def IMEM_breakpoints(layouts):
+    """
+    Finds the IMEM sizes at which the redistribution of an array count changes.
+
+    The redistribution only compares the IMEM size with the instruction bytes of contiguous kernel ranges of each
+    cluster: a range is split when its size is bigger than the IMEM size. The bins are therefore the same for all
+    IMEM sizes between two consecutive range sizes.
+
+    Args:
+        layouts (list): The cluster layouts and next bin ID of every array, as returned by cluster_layouts.
+
+    Returns:
+        list: The sorted sizes of the kernel ranges of every cluster, in bytes.
+    """
+    breakpoints = set()
+    for cluster_layout, bin_id in layouts:
+        for key, cluster, kernel_slices, prefix_sizes in cluster_layout:
+            for first in range(len(prefix_sizes) - 1):
+                for end in range(first + 1, len(prefix_sizes)):
+                    breakpoints.add(prefix_sizes[end] - prefix_sizes[first])
+    return sorted(breakpoints)
+
+def search_IMEM_size(context, array_count, IMEM_sizes, exhaustive=False):
+    """
+    Finds the IMEM size of minimum Array_Area + IMEM_Area among the given ones, placing as few of them as possible.
+
+    The bins, and so the placement and the number of PEs, do not change between two breakpoints of IMEM_breakpoints,
+    while the area grows with the IMEM size for a given number of PEs. The smallest IMEM size at or above each breakpoint,
+    found by bisection of the IMEM sizes, is therefore the only candidate of its interval. Candidates are placed by
+    increasing lower bound of their area, until the bound of the next one is no smaller than the best area found.
+
+    Args:
+        context (Run_Context): The context of the run, with the parsed trace.
+        array_count (int): The number of arrays.
+        IMEM_sizes (list): The sorted IMEM sizes to search, in bytes.
+        exhaustive (bool, optional): Whether every IMEM size is placed. Defaults to False.
+
+    Returns:
+        tuple: A tuple containing:
+            - best (tuple): The row of the IMEM size of minimum area.
+            - rows (list): The rows of the placed IMEM sizes, by IMEM size.
+    """
+    layouts = cluster_layouts(context, array_count)
+    # IMEM sizes smaller than a kernel cannot be redistributed
+    smallest_feasible = max(max(prefix_sizes[index + 1] - prefix_sizes[index] for index in range(len(prefix_sizes) - 1))
+                            for cluster_layout, bin_id in layouts for key, cluster, kernel_slices, prefix_sizes in cluster_layout)
+    feasible_sizes = IMEM_sizes[bisect.bisect_left(IMEM_sizes, smallest_feasible):]
+    if not feasible_sizes:
+        print("No IMEM size of the range fits the biggest kernel of", smallest_feasible, "bytes!! Exiting ...")
+        sys.exit(1)
+
+    if exhaustive:
+        candidates = list(feasible_sizes)
+    else:
+        candidates = {feasible_sizes[0]}
+        for breakpoint in IMEM_breakpoints(layouts):
+            position = bisect.bisect_left(feasible_sizes, breakpoint)
+            if position < len(feasible_sizes):
+                candidates.add(feasible_sizes[position])
+        candidates = sorted(candidates)
+
+    bounded_candidates = []
+    for IMEM_size in candidates:
+        array_bins = [redistribute_layouts(context, cluster_layout, bin_id, IMEM_size) for cluster_layout, bin_id in layouts]
+        bounded_candidates.append((lower_bounds(context, array_bins, IMEM_size, array_count)[0], IMEM_size))
+    bounded_candidates.sort()
+
+    best = None
+    rows = []
+    for area_bound, IMEM_size in bounded_candidates:
+        if not exhaustive and best is not None and area_bound >= best[4]:
+            break
+        objectives, row = evaluate(context, layouts, IMEM_size, array_count)
+        rows.append(row)
+        if best is None or (row[4], row[2]) < (best[4], best[2]):
+            best = row
+    context.profile.count("IMEM_sizes_placed", len(rows))
+    return best, sorted(rows, key=lambda row: row[2])
+
+def write_search_csv(output_path, rows):
+    with open(output_path, mode="w", newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(("Heterogeneity_Type", "Number of Arrays", "IMEM_Size", "IMEM_Lines", "Total_Area", "Array_Area", "IMEM_Area",
+                         "Cluster_Count", "Number_of_PEs", "Array Sizes"))
+        writer.writerows(rows)
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.granularity < 1 or args.min_IMEM_lines > args.max_IMEM_lines:
+        print("The IMEM range must not be empty and the granularity must be positive!! Exiting ...")
+        sys.exit(1)
+    config = Sweep_Config(array_count=ast.literal_eval(args.array_count), initial_array_size=ast.literal_eval(args.initial_array_size),
+                          homogeneous=args.heterogeneity_type, ED_kurtosis_mode=args.ED_kurtosis_mode, packer=args.packer,
+                          validation=args.validation, timing_cache=args.timing_cache, cache_path=args.cache_dir, save_clusters=0, plots="none")
+    context = Run_Context(config)
+    context.personality_dict = load_trace(context, config.timing_file_path, config.model_file_path)
+    IMEM_sizes = [IMEM_lines * 8 for IMEM_lines in range(args.min_IMEM_lines, args.max_IMEM_lines + 1, args.granularity)]
+
+    rows = []
+    for array_count in range(config.array_count[0], config.array_count[1] + 1):
+        start_time = time.time()
+        best, array_count_rows = search_IMEM_size(context, array_count, IMEM_sizes, args.exhaustive)
+        rows.extend(array_count_rows)
+        print(f"{array_count} arrays: placed {len(array_count_rows)} of {len(IMEM_sizes)} IMEM sizes in {time.time() - start_time:.2f} seconds,",
+              f"minimum area {best[4]} at {best[3]} lines")
+
+    output_directory = os.path.dirname(args.output)
+    if output_directory:
+        os.makedirs(output_directory, exist_ok=True)
+    write_search_csv(args.output, rows)
+    print("Saved the placed IMEM sizes to", args.output)
@@ -3,63 +3,84 @@ import ast
 import sys
 import json
 import csv
-import copy
 sys.path.append('.')
-import common as common
-import concurrent.futures
 
-from greedy_clustering.placement import place
-from utils import row_buffer_area_calculation, PE_array_area_calculation, IMEM_area_calculation
+from greedy_clustering.placement import place, visualize_placement
+from utils import array_area_calculation
+from worker_pool import run_tasks, write_async
+from results_cache import placement_key, load_result, save_result
+from checkpoints import save_checkpoint, is_completed, checkpoint_rows
+
+def save_locations(context, array_locs, IMEM_size, output_locations_path):
+    output_file_path = f"{output_locations_path}/{int(IMEM_size/8)}_lines.json"
+    with open(output_file_path, 'w') as json_file:
+        json.dump(array_locs, json_file, indent=1)
+    context.profile.count_file(output_file_path)
+
+def save_completed_IMEM_size(context, array_locs, IMEM_size, output_locations_path, array_count, csv_data, packing_data):
+    # The points of the IMEM size are complete once their locations are written, so the checkpoint follows in the same job
+    save_locations(context, array_locs, IMEM_size, output_locations_path)
+    save_checkpoint(context.base_path, array_count, IMEM_size, csv_data, packing_data)
 
 # Function to perform placement for a given IMEM size
-def process_imem_size(IMEM_size, output_grids_path, output_locations_path, ds3_array_size=None, array_size=None, array_count=None):
-    common.current_IMEM_size = IMEM_size
+def process_imem_size(context, IMEM_size, output_grids_path, output_locations_path, ds3_array_size=None, array_size=None, array_count=None, array_bins=None):
+    context.current_IMEM_size = IMEM_size
 
-    # Read clustering data
     array_locs = {}
     array_sizes = []
+    packing_time = 0
     for array_id in range(array_count):
-        with open(f"{common.redistributed_clusters_path}{int(IMEM_size / 8)}_lines_" + str(array_count) + "_arrays_id_" + str(array_id) + ".json", 'r') as json_file:
-            bins = json.load(json_file)
-
-        copy_bins = copy.deepcopy(bins)
-
-        # Perform the placement for the given IMEM_size
-        individual_array_locs, array_size = place(copy_bins, output_grids_path, array_id=array_id)
+        if array_bins is not None:
+            # Clustering data handed over in memory by the clustering sweep
+            bins = array_bins[array_id][IMEM_size]
+        else:
+            # Read clustering data
+            with open(f"{context.redistributed_clusters_path}{int(IMEM_size / 8)}_lines_" + str(array_count) + "_arrays_id_" + str(array_id) + ".json", 'r') as json_file:
+                bins = json.load(json_file)
+
+        key, cached_placement = None, None
+        if context.config.results_cache and array_id in context.results_keys:
+            key = placement_key(context, context.results_keys[array_id][IMEM_size])
+            cached_placement = load_result(context, key)
+
+        if cached_placement is not None:
+            # Placement of an earlier run with the same inputs, only the plot is redrawn
+            individual_array_locs, array_size, array_packing_time = cached_placement["locations"], tuple(cached_placement["array_size"]), 0.0
+            visualize_placement(context, list(individual_array_locs.keys()), (array_size[1], array_size[0]), array_id, output_grids_path)
+        else:
+            # Perform the placement for the given IMEM_size
+            individual_array_locs, array_size, array_packing_time = place(context, bins, output_grids_path, array_id=array_id)
+            if key is not None:
+                write_async(save_result, context.config.cache_path, key, {"locations": individual_array_locs, "array_size": list(array_size)})
         array_locs[array_id] = individual_array_locs
         array_sizes.append(array_size)
-
-        # Dumping the locations
-        with open(f"{output_locations_path}/{int(IMEM_size/8)}_lines.json", 'w') as json_file:
-            json.dump(array_locs, json_file, indent=1)
-    
-    final_number_of_PEs = None
-    final_PE_array_area = None
-    final_IMEM_area = None
+        packing_time += array_packing_time
 
     if isinstance(array_size, tuple):
-        # Calculating the number of PEs
-        final_number_of_PEs = 0
-        for final_array_size in array_sizes:
-            final_number_of_PEs += final_array_size[0] * final_array_size[1]
-        # PE area given array size and number of arrays
-        final_PE_array_area = PE_array_area_calculation(int(IMEM_size/8), final_number_of_PEs)
-        # Buffer and crossbar area incorporation given row count and number of arrays
-        final_PE_array_area += row_buffer_area_calculation(array_size[0]) * array_count
-        # Converting to mm²
-        final_PE_array_area /= 1000000
-        final_IMEM_area = IMEM_area_calculation(int(IMEM_size/8), final_number_of_PEs)
+        final_number_of_PEs, final_PE_array_area, final_IMEM_area = array_area_calculation(IMEM_size, array_sizes, array_count)
+        final_array_size = array_sizes[-1]
     else:
         print("Hey, you messed something up real bad! Array size should be tuple\n")
         print("Exiting...")
         exit()
-    return (IMEM_size, final_number_of_PEs, array_count, final_PE_array_area, final_IMEM_area, len(bins), final_array_size, array_sizes)
+    # Array sizes are (columns, rows)
+    packing_data = (IMEM_size, context.config.packer, round(packing_time, 6), [size[1] for size in array_sizes])
+    csv_data = (IMEM_size, final_number_of_PEs, array_count, final_PE_array_area, final_IMEM_area, len(bins), final_array_size, array_sizes)
 
-def array_sweep(array_size=None, array_count=None):
+    # Dumping the locations, then the checkpoint of the IMEM size
+    write_async(save_completed_IMEM_size, context, array_locs, IMEM_size, output_locations_path, array_count, csv_data, packing_data)
+    return csv_data, packing_data
+
+def process_imem_size_task(context, data, IMEM_size):
+    output_grids_path, output_locations_path, array_count, array_bins = data
+    with context.profile.stage("placement", IMEM_size):
+        return process_imem_size(context, IMEM_size, output_grids_path, output_locations_path, array_count=array_count, array_bins=array_bins)
+
+def array_sweep(context, array_size=None, array_count=None, array_bins=None):
 
     # If ds3_integration is true, row and column count is swapped
-    placement_base_path = common.placement_base_path + str(array_count) + "_arrays_" + str(common.initial_array_size) + "_initial_size"
-    data_base_path = common.data_base_path + str(array_count) + "_arrays_" + str(common.initial_array_size) + "_initial_size"
+    placement_base_path = context.placement_base_path + str(array_count) + "_arrays_" + str(context.config.initial_array_size) + "_initial_size"
+    data_base_path = context.data_base_path + str(array_count) + "_arrays_" + str(context.config.initial_array_size) + "_initial_size"
 
     output_grids_path = placement_base_path + '/grids'
     if not os.path.exists(output_grids_path):
@@ -70,19 +91,33 @@ def array_sweep(array_size=None, array_count=None):
         os.makedirs(placement_base_path + '/locations')
     csv_data = [("IMEM_Size", "Number_of_PEs", "Number of Arrays", "Array_Area", "IMEM_Area", "Cluster_Count", "Uniform Array Size", "Array Sizes")]
 
-    with concurrent.futures.ProcessPoolExecutor(max_workers=common.number_of_workers) as executor:
-        futures = {executor.submit(process_imem_size, IMEM_size, output_grids_path, output_locations_path, 
-                                   array_count=array_count): IMEM_size for IMEM_size in common.IMEM_size_list}
+    packing_data = [("IMEM_Size", "Packer", "Packing_Time", "Array Heights")]
 
-        for future in concurrent.futures.as_completed(futures):
-            result = future.result()
-            csv_data.append(result)
+    # IMEM sizes completed by the run being resumed keep their rows, only the others are placed
+    pending_IMEM_sizes = [IMEM_size for IMEM_size in context.IMEM_size_list if not is_completed(context, array_count, IMEM_size)]
+    results = [checkpoint_rows(context, array_count, IMEM_size) for IMEM_size in context.IMEM_size_list if is_completed(context, array_count, IMEM_size)]
+    results += run_tasks(context, process_imem_size_task, pending_IMEM_sizes, (output_grids_path, output_locations_path, array_count, array_bins))
+    csv_data.extend(result[0] for result in results)
+    packing_data.extend(result[1] for result in results)
 
     sorted_data = [csv_data[0]] + sorted(csv_data[1:], key=lambda x: x[0])
+    sorted_packing_data = [packing_data[0]] + sorted(packing_data[1:], key=lambda x: x[0])
 
     if not os.path.exists(data_base_path):
         os.makedirs(data_base_path)
 
     with open(f"{data_base_path}/data.csv", mode="w", newline='') as csv_file:
         writer = csv.writer(csv_file)
-        writer.writerows(sorted_data)
\ No newline at end of file
+        writer.writerows(sorted_data)
+    context.profile.count_file(f"{data_base_path}/data.csv")
+
+    # Packing time and resulting array heights of each IMEM size, to trade placement speed against area
+    with open(f"{data_base_path}/packing.csv", mode="w", newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerows(sorted_packing_data)
+    context.profile.count_file(f"{data_base_path}/packing.csv")
+
+    total_packing_time = sum(row[2] for row in sorted_packing_data[1:])
+    tallest_array = max(max(row[3]) for row in sorted_packing_data[1:])
+    print(f"Packing with {context.config.packer}: {total_packing_time:.3f} s, tallest array {tallest_array} rows")
+    return sorted_data, sorted_packing_data
\ No newline at end of file
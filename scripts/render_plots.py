@@ -0,0 +1,33 @@
+# Renders the placement plots of a run that was performed with --plots deferred
+import os
+import sys
+import glob
+import json
+import argparse
+sys.path.append('.')
+
+from greedy_clustering.placement import render_placement
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Batch rendering of deferred placement plots.")
+
+    parser.add_argument('run_dir', type=str, help='output directory of the run, or any directory above its grids')
+    parser.add_argument('--format', type=str, default="pdf", choices=["png", "pdf"], help='format of the rendered plots')
+    parser.add_argument('--keep_rectangles', type=int, default=0, help='0: delete the rectangle files after rendering, 1: keep them')
+
+    args = parser.parse_args()
+    return args
+
+def render_plots(run_dir, plot_format="pdf", keep_rectangles=0):
+    rectangle_files = sorted(glob.glob(os.path.join(glob.escape(run_dir), "**", "grids", "IMEM_*_lines", "array_*.json"), recursive=True))
+    for rectangle_file in rectangle_files:
+        with open(rectangle_file, 'r') as json_file:
+            placement = json.load(json_file)
+        render_placement(placement["rectangles"], tuple(placement["grid_size"]), os.path.splitext(rectangle_file)[0] + "." + plot_format)
+        if not keep_rectangles:
+            os.remove(rectangle_file)
+    return len(rectangle_files)
+
+if __name__ == "__main__":
+    args = parse_args()
+    print("Rendered", render_plots(args.run_dir, args.format, args.keep_rectangles), "plots")
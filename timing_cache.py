@@ -0,0 +1,85 @@
+# On-disk cache of the preprocessed timing data, stored as memory-mappable .npy columns
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+
+from data_structures import Timing_Data
+
+# Bump when the layout of the cached columns changes
+cache_version = 2
+column_names = ["start", "end", "subband", "array_id", "shape", "kernel"]
+
+def file_digest(file_path, digest):
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+
+def timing_cache_key(timing_file_path, model_file_path, kernel_key_list):
+    """
+    Computes the cache key of a timing trace from the contents of the trace and of the kernel model.
+
+    Args:
+        timing_file_path (str): The path of the timing trace.
+        model_file_path (str): The path of the kernel model CSV file.
+        kernel_key_list (dict): The mapping from kernel names to trace keys.
+
+    Returns:
+        str: A hex digest that changes whenever the trace, the kernel model or the mapping change.
+    """
+    digest = hashlib.sha256()
+    digest.update(str(cache_version).encode())
+    digest.update(json.dumps(kernel_key_list).encode())
+    file_digest(model_file_path, digest)
+    file_digest(timing_file_path, digest)
+    return digest.hexdigest()
+
+def timing_cache_path(cache_path, cache_key):
+    return os.path.join(cache_path, "timing_data", cache_key)
+
+def load_timing_data(cache_path, cache_key):
+    """
+    Loads cached timing data, with its columns memory-mapped.
+
+    Args:
+        cache_path (str): The cache directory.
+        cache_key (str): The key returned by timing_cache_key.
+
+    Returns:
+        Timing_Data: The cached timing data, or None if it is not cached.
+    """
+    path = timing_cache_path(cache_path, cache_key)
+    if not os.path.isdir(path):
+        return None
+
+    with open(os.path.join(path, "kernel_names.json"), 'r') as json_file:
+        kernel_names = json.load(json_file)
+    columns = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r") for name in column_names}
+    return Timing_Data(kernel_names, **columns)
+
+def save_timing_data(cache_path, cache_key, timing_data):
+    """
+    Saves timing data to the cache. The entry is written to a temporary directory first and moved in place at once,
+    so concurrent runs never see a partial entry.
+
+    Args:
+        cache_path (str): The cache directory.
+        cache_key (str): The key returned by timing_cache_key.
+        timing_data (Timing_Data): The timing data of all arrays.
+    """
+    path = timing_cache_path(cache_path, cache_key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    temp_path = tempfile.mkdtemp(dir=os.path.dirname(path))
+    for name in column_names:
+        np.save(os.path.join(temp_path, name + ".npy"), getattr(timing_data, name))
+    with open(os.path.join(temp_path, "kernel_names.json"), 'w') as json_file:
+        json.dump(timing_data.kernel_names, json_file)
+
+    try:
+        os.rename(temp_path, path)
+    except OSError:
+        # Another run saved the same entry in the meantime
+        shutil.rmtree(temp_path, ignore_errors=True)
@@ -0,0 +1,82 @@
+# Incremental reader of timing traces, which never holds more than a chunk of the raw JSON in memory
+import json
+
+class Trace_Reader():
+    def __init__(self, file, chunk_size=1 << 20):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.position = 0
+        self.exhausted = False
+
+    def fill(self):
+        # Drop the consumed text and append the next chunk of the file
+        chunk = self.file.read(self.chunk_size)
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        if not chunk:
+            self.exhausted = True
+        return bool(chunk)
+
+    def peek(self):
+        # Returns the next non-whitespace character without consuming it, or "" at the end of the file
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in " \t\n\r":
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.fill():
+                return ""
+
+    def expect(self, characters):
+        character = self.peek()
+        if not character or character not in characters:
+            raise ValueError(f"Malformed timing trace: expected one of {characters!r} but found {character!r}")
+        self.position += 1
+        return character
+
+    def decode(self):
+        # Decodes the next JSON value, reading more chunks until it is complete
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+                # A value reaching the end of the buffer may continue in the next chunk
+                if end < len(self.buffer) or self.exhausted:
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.exhausted:
+                    raise
+            self.fill()
+
+def iterate_trace_records(timing_file_path, chunk_size=1 << 20):
+    """
+    Iterates over the records of a timing trace of the form {"trace key": [record, ...], ...}, reading it in chunks.
+
+    Args:
+        timing_file_path (str): The path of the timing trace.
+        chunk_size (int, optional): The number of characters read at once. Defaults to 1 MiB.
+
+    Yields:
+        tuple: The trace key and the record, a [start, end, subband, [height, width], array id] list.
+    """
+    with open(timing_file_path, 'r') as file:
+        reader = Trace_Reader(file, chunk_size)
+        reader.expect("{")
+        if reader.peek() == "}":
+            return
+        while True:
+            key = reader.decode()
+            reader.expect(":")
+            reader.expect("[")
+            if reader.peek() == "]":
+                reader.expect("]")
+            else:
+                while True:
+                    yield key, reader.decode()
+                    if reader.expect(",]") == "]":
+                        break
+            if reader.expect(",}") == "}":
+                break
@@ -1,11 +1,12 @@
-import pandas as pd
-import ast
 import json
-import copy
+import array
 import os
+import numpy as np
 
-import common as common
 from data_structures import *
+from timing_cache import timing_cache_key, load_timing_data, save_timing_data
+from trace_reader import iterate_trace_records
+from kernel_model import load_kernel_registry
 
 kernel_key_list = {    "Kurtosis_0"        : ["Kurtosis1_b1", "Kurtosis2_b1"], 
                             "AEP_det_0"         : ["AEPDet_b1"], 
@@ -47,79 +48,143 @@ kernel_key_list = {    "Kurtosis_0"        : ["Kurtosis1_b1", "Kurtosis2_b1"],
                             "OFDM_Est_cyclo_0"             : ["OFDM_Est_cyclo"], 
                             }
 
-def custom_key(item):
-    if isinstance(item.slice[0], (int, float)):
-        return int(item.slice[0])  
-    elif isinstance(item[0], list):
-        return int(item[0][0])
+def build_timing_data(raw_timing_data, personality_dict):
 
-def process_timing_data(personality_dict, array_count=None):
+    kernel_names = list(kernel_key_list.keys())
 
-    copy_timing_data = copy.deepcopy(common.timing_data.data)
+    start, end, subband, array_id, shape, kernel = [], [], [], [], [], []
 
-    new_timing_data = {}
-
-    for array_id in range(array_count):
-        new_timing_data[array_id] = {}
-        for key, value in kernel_key_list.items():
-            new_timing_data[array_id][key] = []
-
-    for new_timing_data_key, new_timing_data_value in kernel_key_list.items():
+    for kernel_code, (new_timing_data_key, new_timing_data_value) in enumerate(kernel_key_list.items()):
         for keys_to_search in new_timing_data_value:
-            if keys_to_search in copy_timing_data.keys():
-                for timing_item in common.timing_data.data[keys_to_search]:
+            if keys_to_search in raw_timing_data:
+                for timing_item in raw_timing_data[keys_to_search]:
                     slice_kernel_shape = (timing_item[3][0], int(timing_item[3][1]))
                     if personality_dict[new_timing_data_key][0] == slice_kernel_shape:
-                        s = Slice(new_timing_data_key, timing_item[0], timing_item[1], int(timing_item[2]), slice_kernel_shape)
-                        new_timing_data[timing_item[4]][new_timing_data_key].append(s)
-
-    copy_new_timing_data = copy.deepcopy(new_timing_data)
-
-    for array_id in range(array_count):
-        for key, value in new_timing_data[array_id].items():
-            if len(value) == 0:
-                copy_new_timing_data[array_id].pop(key)
-        
-    new_timing_data = copy_new_timing_data
-
-    common.timing_data.data = new_timing_data
-
-    for array_id in range(array_count):
-        for key, value in common.timing_data.data[array_id].items():
-            common.timing_data.data[array_id][key] = sorted(value, key=custom_key)
-
-def preprocess(timing_file_path=None, array_count=None): 
-    csv_file = pd.read_csv('ACC_model.csv')
-
-    pers_list = []
-    for index, entry in csv_file.iterrows():
-        # print(entry)
-        # print(entry['PE shape'])
-        if entry['PE shape'].split(';')[0] == "0,0":
-            continue
-        pers_list.append(str(entry['Config']))
-
-    personality_dict = {}
-    for key in pers_list:
-        key_id = 0
-        for index, entry in csv_file.iterrows():
-            kernel_name = entry['Config']
-
-            if key == kernel_name:
-                for partitioned_shape in entry['PE shape'].split(';'):
-                    personality_dict[key + "_" + str(key_id)] = [ast.literal_eval(partitioned_shape), entry['Instructions'] * 8]
-                    key_id += 1
-    
-    if timing_file_path != None:
+                        start.append(timing_item[0])
+                        end.append(timing_item[1])
+                        subband.append(timing_item[2])
+                        array_id.append(timing_item[4])
+                        shape.append(slice_kernel_shape)
+                        kernel.append(kernel_code)
+
+    timing_data = Timing_Data(kernel_names,
+                              np.array(start, dtype=np.float64),
+                              np.array(end, dtype=np.float64),
+                              np.array(subband, dtype=np.int32),
+                              np.array(array_id, dtype=np.int32),
+                              np.array(shape, dtype=np.int32).reshape(-1, 2),
+                              np.array(kernel, dtype=np.int16))
+    return timing_data
+
+def stream_timing_data(timing_file_path, personality_dict, chunk_size=1 << 20):
+    # Same rows as build_timing_data, but the trace is parsed in chunks and only kept slices are buffered
+
+    kernel_names = list(kernel_key_list.keys())
+
+    # Trace key -> (kernel code, rank of the trace key within the kernel, kernel name) of each kernel it maps to
+    trace_key_kernels = {}
+    for kernel_code, (new_timing_data_key, new_timing_data_value) in enumerate(kernel_key_list.items()):
+        for key_rank, keys_to_search in enumerate(new_timing_data_value):
+            trace_key_kernels.setdefault(keys_to_search, []).append((kernel_code, key_rank, new_timing_data_key))
+
+    # Compact column buffers of the kept slices
+    buffers = {"start": array.array('d'), "end": array.array('d'), "subband": array.array('i'), "array_id": array.array('i'),
+               "height": array.array('i'), "width": array.array('i'), "kernel": array.array('h'), "key_rank": array.array('h')}
+    for keys_to_search, timing_item in iterate_trace_records(timing_file_path, chunk_size):
+        for kernel_code, key_rank, new_timing_data_key in trace_key_kernels.get(keys_to_search, []):
+            slice_kernel_shape = (timing_item[3][0], int(timing_item[3][1]))
+            if personality_dict[new_timing_data_key][0] == slice_kernel_shape:
+                buffers["start"].append(timing_item[0])
+                buffers["end"].append(timing_item[1])
+                buffers["subband"].append(int(timing_item[2]))
+                buffers["array_id"].append(int(timing_item[4]))
+                buffers["height"].append(int(slice_kernel_shape[0]))
+                buffers["width"].append(int(slice_kernel_shape[1]))
+                buffers["kernel"].append(kernel_code)
+                buffers["key_rank"].append(key_rank)
+
+    if not len(buffers["kernel"]):
+        return Timing_Data(kernel_names)
+
+    # Order the rows like build_timing_data does: by kernel, then trace key, then position in the trace
+    columns = {name: np.frombuffer(buffer, dtype=buffer.typecode) for name, buffer in buffers.items()}
+    order = np.lexsort((np.arange(len(columns["kernel"])), columns["key_rank"], columns["kernel"]))
+    return Timing_Data(kernel_names,
+                       start=columns["start"][order],
+                       end=columns["end"][order],
+                       subband=columns["subband"][order].astype(np.int32),
+                       array_id=columns["array_id"][order].astype(np.int32),
+                       shape=np.stack((columns["height"][order], columns["width"][order]), axis=1).astype(np.int32),
+                       kernel=columns["kernel"][order].astype(np.int16))
+
+def load_trace(context, timing_file_path, model_file_path='ACC_model.csv'):
+    """
+    Parses the kernel models and the timing trace once per run into an array-agnostic form: the rows of all
+    arrays, stably sorted by array id, so that the rows of each array are a contiguous range in trace order.
+
+    Args:
+        context (Run_Context): The context of the run, whose kernel registry, trace and array offsets are set.
+        timing_file_path (str): The path of the timing trace.
+        model_file_path (str, optional): The path of the kernel models. Defaults to 'ACC_model.csv'.
+
+    Returns:
+        dict: The personality_dict of the kernel models.
+    """
+    context.kernel_registry = load_kernel_registry(model_file_path)
+    personality_dict = context.kernel_registry.personality_dict
+
+    timing_data = None
+    cache_key = None
+    if context.config.timing_cache:
+        cache_key = timing_cache_key(timing_file_path, model_file_path, kernel_key_list)
+        timing_data = load_timing_data(context.config.cache_path, cache_key)
+
+    if timing_data is None and context.config.streaming_ingest:
+        timing_data = stream_timing_data(timing_file_path, personality_dict)
+        if cache_key is not None:
+            save_timing_data(context.config.cache_path, cache_key, timing_data)
+    elif timing_data is None:
         with open(timing_file_path, 'r') as file:
-            common.timing_data.data = json.load(file)
+            raw_timing_data = json.load(file)
+        timing_data = build_timing_data(raw_timing_data, personality_dict)
+        if cache_key is not None:
+            save_timing_data(context.config.cache_path, cache_key, timing_data)
+
+    order = np.argsort(timing_data.array_id, kind="stable")
+    context.trace_timing_data = timing_data.select(order)
+    context.trace_array_ids, context.trace_array_offsets = np.unique(context.trace_timing_data.array_id, return_index=True)
+    context.trace_paths = (timing_file_path, model_file_path)
+    return personality_dict
 
-        process_timing_data(personality_dict, array_count)
+def partition_trace(context, array_count):
+    # Per-array timing data of an array count, whose columns are views of the rows of each array in the parsed trace
+    timing_data = context.trace_timing_data
+    out_of_range = [int(array_id) for array_id in context.trace_array_ids if not 0 <= array_id < array_count]
+    if out_of_range:
+        raise ValueError(f"The timing trace has slices of array ids {out_of_range}, which do not exist with {array_count} arrays")
+    ends = np.append(context.trace_array_offsets[1:], len(timing_data.array_id))
+    bounds = {int(array_id): (first, end) for array_id, first, end in zip(context.trace_array_ids, context.trace_array_offsets, ends)}
+    array_timing_data = {}
+    for current_array_id in range(array_count):
+        first, end = bounds.get(current_array_id, (0, 0))
+        rows = slice(first, end)
+        array_timing_data[current_array_id] = Timing_Data(timing_data.kernel_names, timing_data.start[rows], timing_data.end[rows],
+                                                          timing_data.subband[rows], timing_data.array_id[rows],
+                                                          timing_data.shape[rows], timing_data.kernel[rows])
+        array_timing_data[current_array_id].index_kernels()
+    context.array_timing_data = array_timing_data
+    return array_timing_data
 
-    if timing_file_path != None:
-        return personality_dict
-    else:
-        return personality_dict
+def preprocess(context, timing_file_path=None, array_count=None, model_file_path='ACC_model.csv'): 
+    # The trace is parsed on the first call of a run only, later array counts only partition it again
+    if timing_file_path is None:
+        context.kernel_registry = load_kernel_registry(model_file_path)
+        return context.kernel_registry.personality_dict
+
+    if context.trace_timing_data is None or context.trace_paths != (timing_file_path, model_file_path):
+        load_trace(context, timing_file_path, model_file_path)
+    partition_trace(context, array_count)
+    return context.kernel_registry.personality_dict
 
 def IMEM_area_calculation(IMEM_size, number_of_PEs):
     # Initial PE area for 64 lines of IMEM for only one PE
@@ -149,12 +214,38 @@ def row_buffer_area_calculation(number_of_rows):
     scale = 8.627
     return float(number_of_rows * number_of_rows * scale)
 
-def calculate_IMEM_sizes():
-    for i in range(common.number_of_IMEM_sizes):
-        common.IMEM_size_list.append((320 + i * 64) * 8)
-        common.IMEM_size_list_lines.append((320 + i * 64))
-        common.IMEM_size_list_KB.append(((320 + i * 64) * 8) / 1024)
-    return common.IMEM_size_list, common.IMEM_size_list_lines, common.IMEM_size_list_KB
+def array_area_calculation(IMEM_size, array_sizes, array_count):
+    """
+    Computes the number of PEs and the areas of the arrays of a placement.
+
+    Args:
+        IMEM_size (int): The IMEM size of the placement.
+        array_sizes (list): The (columns, rows) size of each array.
+        array_count (int): The number of arrays.
+
+    Returns:
+        tuple: The number of PEs, the PE array area in mm² and the IMEM area.
+    """
+    # Calculating the number of PEs
+    number_of_PEs = 0
+    for array_size in array_sizes:
+        number_of_PEs += array_size[0] * array_size[1]
+    # PE area given array size and number of arrays
+    PE_array_area = PE_array_area_calculation(int(IMEM_size/8), number_of_PEs)
+    # Buffer and crossbar area incorporation given row count and number of arrays
+    PE_array_area += row_buffer_area_calculation(array_sizes[-1][0]) * array_count
+    # Converting to mm²
+    PE_array_area /= 1000000
+    IMEM_area = IMEM_area_calculation(int(IMEM_size/8), number_of_PEs)
+    return number_of_PEs, PE_array_area, IMEM_area
+
+def calculate_IMEM_sizes(number_of_IMEM_sizes):
+    IMEM_size_list, IMEM_size_list_lines, IMEM_size_list_KB = [], [], []
+    for i in range(number_of_IMEM_sizes):
+        IMEM_size_list.append((320 + i * 64) * 8)
+        IMEM_size_list_lines.append((320 + i * 64))
+        IMEM_size_list_KB.append(((320 + i * 64) * 8) / 1024)
+    return IMEM_size_list, IMEM_size_list_lines, IMEM_size_list_KB
 
 def print_dict(dict):
     for key, value in dict.items():
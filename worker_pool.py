@@ -0,0 +1,121 @@
+# Process pool used by the clustering and placement sweeps
+import os
+import threading
+import multiprocessing
+import concurrent.futures
+
+from profiler import Profile
+
+# Run context and read-only data handed to the workers once, at start up
+worker_context = None
+worker_data = None
+
+# Background thread writing output files while the sweep goes on, shared by the runs of this process
+writer = None
+pending_writes = []
+writes_lock = threading.Lock()
+
+def init_worker(context, data):
+    """
+    Initializes a worker with the run context and the read-only data of the sweep.
+
+    Args:
+        context (Run_Context): The context of the run, without its profile.
+        data: Read-only data shared by all tasks, handed to the function of each task.
+    """
+    global worker_context, worker_data, writer, pending_writes, writes_lock
+    worker_context = context
+    worker_data = data
+    # A forked worker does not inherit the writer thread of its parent
+    writer = None
+    pending_writes = []
+    writes_lock = threading.Lock()
+
+def write_async(function, *args):
+    """
+    Runs an output writing function on the background writer thread of this process.
+
+    Args:
+        function (callable): The function writing the output.
+        *args: The arguments of the function.
+    """
+    global writer
+    with writes_lock:
+        if writer is None:
+            writer = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        pending_writes.append(writer.submit(function, *args))
+
+def wait_for_writes():
+    """
+    Waits until every output submitted with write_async is written, and raises the first error of a failed write.
+    """
+    while True:
+        with writes_lock:
+            if not pending_writes:
+                return
+            pending_write = pending_writes.pop(0)
+        pending_write.result()
+
+def stop_writer():
+    """
+    Waits for the pending writes and stops the writer thread. A child forked while the thread is alive could inherit
+    a lock of its queue in the held state and deadlock, so the thread is stopped before forking and restarted by
+    the next write_async.
+    """
+    global writer
+    wait_for_writes()
+    with writes_lock:
+        if writer is not None:
+            writer.shutdown(wait=True)
+            writer = None
+
+def available_cpus():
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def run_worker_task(function_and_task):
+    function, task = function_and_task
+    # Each task reports only what it recorded itself, to be merged into the parent's profile
+    worker_context.profile = Profile(worker_context.config.profile_stages, worker_context.config.profile_memory)
+    result = function(worker_context, worker_data, task)
+    # Outputs of a task are complete once the task returns
+    wait_for_writes()
+    return result, worker_context.profile.snapshot()
+
+def run_tasks(context, function, tasks, data=None):
+    """
+    Runs the function for every task, in parallel if the configuration of the run has more than one worker.
+    The number of workers is capped by the number of available CPUs, as extra processes only add the cost of starting
+    them and of sending the results back, so the tasks run serially on a single CPU. Workers are forked where the
+    platform allows it, so the run context and the read-only data are inherited without being pickled. With the spawn
+    start method, they are pickled once per worker rather than once per task. Tasks only carry their own small arguments.
+
+    Args:
+        context (Run_Context): The context of the run.
+        function (callable): A picklable module level function taking the context, the data and one task.
+        tasks (list): The arguments of each task.
+        data (optional): Read-only data shared by all tasks.
+
+    Returns:
+        list: The results of the tasks, in the order of the tasks.
+    """
+    number_of_workers = min(context.config.number_of_workers or 1, available_cpus(), len(tasks))
+    if number_of_workers <= 1:
+        return [function(context, data, task) for task in tasks]
+
+    # Forked workers must inherit neither a half-written output nor the writer thread
+    stop_writer()
+
+    if "fork" in multiprocessing.get_all_start_methods():
+        mp_context = multiprocessing.get_context("fork")
+    else:
+        mp_context = multiprocessing.get_context("spawn")
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=number_of_workers, mp_context=mp_context,
+                                                initializer=init_worker, initargs=(context, data)) as executor:
+        results = []
+        for result, worker_profile in executor.map(run_worker_task, [(function, task) for task in tasks]):
+            context.profile.merge(worker_profile)
+            results.append(result)
+        return results